@@ -0,0 +1,73 @@
+# coding=utf8
+
+"""
+Rewrite an image database (imdb_*.h5, see vg_to_imdb.py) with one image
+per HDF5 chunk. vg_hdf5.im_getter then reads a single chunk per image, and
+with compression the zero padding of the images costs (almost) no disk
+space or I/O. All other datasets are copied unchanged.
+"""
+
+import argparse, time
+
+import h5py
+import numpy as np
+
+
+def repack_images(src, dst, args):
+    images = src['images']
+    num_images = images.shape[0]
+    compression_opts = None
+    if args.compression == 'gzip':
+        compression_opts = args.gzip_level
+    compression = args.compression if args.compression != 'none' else None
+    out = dst.create_dataset('images', images.shape, dtype=images.dtype,
+                             chunks=(1,) + images.shape[1:],
+                             compression=compression,
+                             compression_opts=compression_opts,
+                             shuffle=False)
+
+    # read many padded images at a time, which is fast for any layout of
+    # the input, and write whole chunks
+    start = time.time()
+    for i in xrange(0, num_images, args.batch_size):
+        out[i:i + args.batch_size] = images[i:i + args.batch_size]
+        n = min(i + args.batch_size, num_images)
+        print('%i/%i images, %.1f images/s' % (n, num_images, n / (time.time() - start)))
+
+
+def main(args):
+    src = h5py.File(args.input, 'r')
+    dst = h5py.File(args.output, 'w')
+    for name in src:
+        if name == 'images':
+            repack_images(src, dst, args)
+        else:
+            src.copy(name, dst)
+    for key, value in src.attrs.items():
+        dst.attrs[key] = value
+
+    if args.verify:
+        heights = src['image_heights'][:]
+        widths = src['image_widths'][:]
+        for i in np.random.choice(len(heights), min(args.verify, len(heights)), replace=False):
+            h, w = heights[i], widths[i]
+            assert np.array_equal(src['images'][i, :, :h, :w], dst['images'][i, :, :h, :w]), i
+        print('verified %i images' % min(args.verify, len(heights)))
+    dst.close()
+    src.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default='imdb_1024.h5')
+    parser.add_argument('--output', default='imdb_1024_chunked.h5')
+    parser.add_argument('--compression', default='lzf', choices=['none', 'lzf', 'gzip'],
+                        help='lzf is fast but can only be read with h5py')
+    parser.add_argument('--gzip_level', default=1, type=int)
+    parser.add_argument('--batch_size', default=64, type=int,
+                        help='number of images read and written at a time')
+    parser.add_argument('--verify', default=100, type=int,
+                        help='number of images to compare with the input afterwards')
+
+    args = parser.parse_args()
+    main(args)
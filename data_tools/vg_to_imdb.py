@@ -3,6 +3,7 @@
 import argparse, os, json, string
 from Queue import Queue
 from threading import Thread, Lock
+from multiprocessing.pool import ThreadPool
 
 import h5py
 import numpy as np
@@ -32,7 +33,23 @@ def encode_filenames(data, filename_to_idx):
     return np.asarray(filename_idxs, dtype=np.int32)
 
 
-def add_images(im_data, h5_file, args):
+def load_image(filename, image_size):
+    """
+    read an image, resize its long side to image_size, return it in BGR
+    (H, W, 3) and its original height and width
+    """
+    img = imread(filename)
+    # handle grayscale
+    if img.ndim == 2:
+        img = img[:, :, None][:, :, [0, 0, 0]]
+    H0, W0 = img.shape[0], img.shape[1]
+    img = imresize(img, float(image_size) / max(H0, W0))
+    # swap rgb to bgr
+    img = np.ascontiguousarray(img[:, :, ::-1])
+    return img, H0, W0
+
+
+def find_images(im_data, h5_file, args):
     fns = []; ids = []; idx = []
     corrupted_ims = ['1592.jpg', '1722.jpg', '4616.jpg', '4617.jpg']
     for i, img in enumerate(im_data):
@@ -50,7 +67,11 @@ def add_images(im_data, h5_file, args):
     idx = np.array(idx, dtype=np.int32)
     h5_file.create_dataset('image_ids', data=ids)
     h5_file.create_dataset('valid_idx', data=idx)
+    return fns
+
 
+def add_images(im_data, h5_file, args):
+    fns = find_images(im_data, h5_file, args)
     num_images = len(fns)
 
     shape = (num_images, 3, args.image_size, args.image_size)
@@ -71,17 +92,8 @@ def add_images(im_data, h5_file, args):
 
             if i % 10000 == 0:
                 print('processing %i images...' % i)
-            img = imread(filename)
-            # handle grayscale
-            if img.ndim == 2:
-                img = img[:, :, None][:, :, [0, 0, 0]]
-            H0, W0 = img.shape[0], img.shape[1]
-            img = imresize(img, float(args.image_size) / max(H0, W0))
+            img, H0, W0 = load_image(filename, args.image_size)
             H, W = img.shape[0], img.shape[1]
-            # swap rgb to bgr. This can't be the best way right? #fail
-            r = img[:,:,0].copy()
-            img[:,:,0] = img[:,:,2]
-            img[:,:,2] = r
 
             lock.acquire()
             original_heights[i] = H0
@@ -107,8 +119,67 @@ def add_images(im_data, h5_file, args):
     return fns
 
 
+def add_image_index(im_data, h5_file, args, raw_file=None):
+    """
+    write the sizes of the images to h5_file and, if raw_file is given, the
+    images tightly packed (BGR, H x W x 3 each) to raw_file and their
+    offsets in it to h5_file (see datasets/vg_memmap.py). Without raw_file
+    the index is for reading the JPEG files (see datasets/vg_jpeg.py).
+    """
+    fns = find_images(im_data, h5_file, args)
+    num_images = len(fns)
+    h5_file.attrs['image_size'] = args.image_size
+
+    image_offsets = np.zeros(num_images, dtype=np.int64)
+    original_heights = np.zeros(num_images, dtype=np.int32)
+    original_widths = np.zeros(num_images, dtype=np.int32)
+    image_heights = np.zeros(num_images, dtype=np.int32)
+    image_widths = np.zeros(num_images, dtype=np.int32)
+
+    # the images are decoded in parallel and written in order
+    pool = ThreadPool(args.num_workers)
+    offset = 0
+    f = open(raw_file, 'wb') if raw_file is not None else None
+    for i, (img, H0, W0) in enumerate(pool.imap(
+            lambda fn: load_image(fn, args.image_size), fns, chunksize=4)):
+        if i % 10000 == 0:
+            print('processing %i images...' % i)
+        image_offsets[i] = offset
+        original_heights[i] = H0
+        original_widths[i] = W0
+        image_heights[i] = img.shape[0]
+        image_widths[i] = img.shape[1]
+        if f is not None:
+            f.write(img.tobytes())
+            offset += img.size
+    pool.close()
+
+    if f is not None:
+        f.close()
+        h5_file.create_dataset('image_offsets', data=image_offsets)
+    h5_file.create_dataset('image_heights', data=image_heights)
+    h5_file.create_dataset('image_widths', data=image_widths)
+    h5_file.create_dataset('original_heights', data=original_heights)
+    h5_file.create_dataset('original_widths', data=original_widths)
+
+    return fns
+
+
 def main(args):
     im_metadata = json.load(open(args.metadata_input))
+    if args.format == 'raw':
+        # imdb_<size>.raw holds the images, imdb_<size>.raw.h5 the index
+        raw_file = os.path.join(args.imh5_dir, 'imdb_' + str(args.image_size) + '.raw')
+        f = h5py.File(raw_file + '.h5', 'w')
+        im_fns = add_image_index(im_metadata, f, args, raw_file)
+        f.close()
+        return
+    if args.format == 'jpeg':
+        # the images are read from the JPEG files, write only the index
+        f = h5py.File(os.path.join(args.imh5_dir, 'imdb_' + str(args.image_size) + '.jpg.h5'), 'w')
+        im_fns = add_image_index(im_metadata, f, args)
+        f.close()
+        return
     h5_fn = 'imdb_' + str(args.image_size) + '.h5'
     # write the h5 file
     h5_file = os.path.join(args.imh5_dir, h5_fn)
@@ -123,6 +194,10 @@ if __name__ == '__main__':
     parser.add_argument('--imh5_dir', default='.')
     parser.add_argument('--num_workers', default=20, type=int)
     parser.add_argument('--metadata_input', default='VG/image_data.json', type=str)
+    parser.add_argument('--format', default='h5', choices=['h5', 'raw', 'jpeg'],
+                        help='h5: padded images in imdb_<size>.h5, raw: packed '
+                             'images in imdb_<size>.raw, index in imdb_<size>.raw.h5, '
+                             'jpeg: only the index of the image files in imdb_<size>.jpg.h5')
 
     args = parser.parse_args()
     main(args)
@@ -630,7 +630,7 @@ def main(args):
 
     print('read image db from %s' % args.imdb)
     imdb = h5.File(args.imdb, 'r')
-    num_im, _, _, _ = imdb['images'].shape
+    num_im = imdb['image_ids'].shape[0]
     img_long_sizes = [512, 1024]
     valid_im_idx = imdb['valid_idx'][:] # valid image indices
     img_ids = imdb['image_ids'][:]
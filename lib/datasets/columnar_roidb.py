@@ -0,0 +1,139 @@
+import numpy as np
+import scipy.sparse
+from utils.shared_mem import share_array
+
+
+class ColumnarRoidb(object):
+    """
+    An array-backed roidb. Boxes, labels and relations of all images are
+    kept in a few flat arrays together with per-image offsets; the usual
+    roidb entry (a dict) of an image is only built when it is indexed, e.g.
+    roidb[i]['boxes']. Flipped images are entries that point to the same
+    image with a flag set, so appending them does not copy anything.
+
+    Entries are built on every access: changing an entry does not change
+    the roidb.
+    """
+
+    # arrays that hold the roidb
+    _columns = ['_boxes', '_labels', '_im_to_first_box', '_im_to_last_box',
+                '_relations', '_predicates', '_im_to_first_rel',
+                '_im_to_last_rel', '_im_sizes', '_entry_to_im', '_flipped']
+
+    def __init__(self, boxes, labels, im_to_first_box, im_to_last_box,
+                 relations, predicates, im_to_first_rel, im_to_last_rel,
+                 im_sizes, num_classes, im_getter):
+        """
+        boxes, labels: boxes (x1, y1, x2, y2) and labels of all images
+        im_to_first_box, im_to_last_box: box range of each image (inclusive)
+        relations, predicates: relations (indices into boxes) of all images
+            and their predicates
+        im_to_first_rel, im_to_last_rel: relation range of each image
+            (inclusive), -1 if an image has no relation
+        im_sizes: (width, height) of each image
+        num_classes: number of object classes (for gt_overlaps)
+        im_getter: a function that returns an image given its index
+        """
+        assert(np.all(im_to_first_box >= 0))
+        assert(im_to_first_box.shape[0] == im_to_last_box.shape[0])
+        assert(im_to_first_rel.shape[0] == im_to_last_rel.shape[0])
+        self._boxes = boxes
+        self._labels = labels
+        self._im_to_first_box = im_to_first_box
+        self._im_to_last_box = im_to_last_box
+        self._relations = relations
+        self._predicates = predicates
+        self._im_to_first_rel = im_to_first_rel
+        self._im_to_last_rel = im_to_last_rel
+        self._im_sizes = im_sizes
+        self._num_classes = num_classes
+        self._im_getter = im_getter
+
+        num_images = im_to_first_box.shape[0]
+        # image index and flip flag of each entry
+        self._entry_to_im = np.arange(num_images)
+        self._flipped = np.zeros(num_images, dtype=bool)
+
+    def __len__(self):
+        return self._entry_to_im.shape[0]
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    @property
+    def widths(self):
+        return self._im_sizes[self._entry_to_im, 0]
+
+    @property
+    def heights(self):
+        return self._im_sizes[self._entry_to_im, 1]
+
+    def append_flipped(self):
+        """
+        append a horizontally flipped copy of every image
+        """
+        self._entry_to_im = np.hstack([self._entry_to_im, self._entry_to_im])
+        self._flipped = np.hstack([self._flipped,
+                                   np.ones_like(self._flipped)])
+
+    def share_memory(self, memo=None):
+        """
+        move all arrays to read-only shared memory (see share_array), so
+        that forked data workers do not copy them
+        """
+        for name in self._columns:
+            setattr(self, name, share_array(getattr(self, name), memo))
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError('roidb index out of range')
+
+        i = self._entry_to_im[idx]
+        first_box = self._im_to_first_box[i]
+        last_box = self._im_to_last_box[i]
+        boxes = self._boxes[first_box:last_box+1, :]
+        gt_classes = self._labels[first_box:last_box+1]
+        num_boxes = boxes.shape[0]
+        width, height = self._im_sizes[i]
+
+        if self._flipped[idx]:
+            boxes = boxes.copy()
+            oldx1 = boxes[:, 0].copy()
+            oldx2 = boxes[:, 2].copy()
+            boxes[:, 0] = width - oldx2 - 1
+            boxes[:, 2] = width - oldx1 - 1
+            assert (boxes[:, 2] >= boxes[:, 0]).all()
+
+        # one-hot class overlaps
+        overlaps = scipy.sparse.csr_matrix(
+            (np.ones(num_boxes), (np.arange(num_boxes), gt_classes)),
+            shape=(num_boxes, self._num_classes))
+
+        # ground-truth relations
+        first_rel = self._im_to_first_rel[i]
+        if first_rel >= 0: # if image has relations
+            last_rel = self._im_to_last_rel[i]
+            obj_idx = self._relations[first_rel:last_rel+1] - first_box
+            assert(np.all(obj_idx>=0) and np.all(obj_idx<num_boxes)) # sanity check
+            gt_relations = np.hstack([obj_idx,
+                self._predicates[first_rel:last_rel+1, np.newaxis]]).astype(np.int64)
+        else:
+            gt_relations = np.zeros((0, 3), dtype=np.int64)
+
+        seg_areas = np.multiply((boxes[:, 2] - boxes[:, 0] + 1),
+                                (boxes[:, 3] - boxes[:, 1] + 1)) # box areas
+
+        return {'boxes': boxes,
+                'gt_classes': gt_classes,
+                'gt_overlaps': overlaps,
+                'gt_relations': gt_relations,
+                'flipped': bool(self._flipped[idx]),
+                'seg_areas': seg_areas,
+                'db_idx': i,
+                'image': lambda im_i=i: self._im_getter(im_i),
+                'roi_scores': np.ones(num_boxes),
+                'width': width,
+                'height': height}
@@ -3,33 +3,106 @@ A helper class for evaluating scene graph prediction tasks
 """
 
 import numpy as np
-from sg_eval import eval_relation_recall
+from fast_rcnn.config import cfg
+from sg_eval import eval_relation_recall, eval_triplet_recall
 
 class SceneGraphEvaluator:
+    """
+    Accumulates the sum and the count of the per-image R@K of a mode, so
+    that the evaluators of different parts of a test set can be merged
+    (see merge, state_dict and load_state_dict)
+    """
 
     def __init__(self, imdb, mode):
         self.roidb = imdb.roidb
-        self.result_dict = {}
         self.mode = mode
 
-        self.result_dict = {}
-        self.result_dict[self.mode + '_recall'] = {20:[], 50:[], 100:[]}
+        self.recall_sum = {k:0. for k in cfg.TEST.RECALL_K}
+        self.recall_count = {k:0 for k in cfg.TEST.RECALL_K}
 
 
-    def evaluate_scene_graph_entry(self, sg_entry, im_idx, iou_thresh):
+    def _image_result_dict(self):
+        # the result_dict of sg_eval, for a single image
+        return {self.mode + '_recall': {k:[] for k in self.recall_sum}}
+
+
+    def _accumulate(self, result_dict):
+        for k, recalls in result_dict[self.mode + '_recall'].items():
+            self.recall_sum[k] += sum(recalls)
+            self.recall_count[k] += len(recalls)
+
+
+    def evaluate_scene_graph_entry(self, sg_entry, im_idx, iou_thresh, roidb_entry=None):
+        """
+        roidb_entry: the prepared (see prepare_roidb) roidb entry of the
+        image, read from the roidb if not given
+        """
+        if roidb_entry is None:
+            roidb_entry = self.roidb[im_idx]
+        result_dict = self._image_result_dict()
         pred_triplets, triplet_boxes = \
-            eval_relation_recall(sg_entry, self.roidb[im_idx],
-                                self.result_dict,
+            eval_relation_recall(sg_entry, roidb_entry,
+                                result_dict,
                                 self.mode,
                                 iou_thresh=iou_thresh)
+        self._accumulate(result_dict)
         return pred_triplets, triplet_boxes
 
 
+    def evaluate_triplets(self, pred_triplets, triplet_boxes, im_idx, iou_thresh, roidb_entry=None):
+        """
+        evaluate the predicted triplets of an image, sorted by score (see
+        sg_eval.relation_triplets), e.g. read back from a prediction dump
+        """
+        if roidb_entry is None:
+            roidb_entry = self.roidb[im_idx]
+        result_dict = self._image_result_dict()
+        evaluated = eval_triplet_recall(pred_triplets, triplet_boxes, roidb_entry,
+                                        result_dict, self.mode,
+                                        iou_thresh=iou_thresh)
+        self._accumulate(result_dict)
+        return evaluated
+
+
+    def recall(self, k):
+        """
+        mean R@k of the images evaluated so far
+        """
+        if self.recall_count[k] == 0:
+            return float('nan')
+        return self.recall_sum[k] / self.recall_count[k]
+
+
+    def merge(self, other):
+        """
+        add the results of another evaluator (or its state_dict) of the
+        same mode
+        """
+        if isinstance(other, SceneGraphEvaluator):
+            other = other.state_dict()
+        assert(other['mode'] == self.mode)
+        for k in other['recall_sum']:
+            self.recall_sum[k] = self.recall_sum.get(k, 0.) + other['recall_sum'][k]
+            self.recall_count[k] = self.recall_count.get(k, 0) + other['recall_count'][k]
+
+
+    def state_dict(self):
+        return {'mode': self.mode,
+                'recall_sum': dict(self.recall_sum),
+                'recall_count': dict(self.recall_count)}
+
+
+    def load_state_dict(self, state):
+        assert(state['mode'] == self.mode)
+        self.recall_sum = dict(state['recall_sum'])
+        self.recall_count = dict(state['recall_count'])
+
+
     def save(self, fn):
-        np.save(fn, self.result_dict)
+        np.save(fn, self.state_dict())
 
 
     def print_stats(self):
         print('======================' + self.mode + '============================')
-        for k, v in self.result_dict[self.mode + '_recall'].items():
-            print('R@%i: %f' % (k, np.mean(v)))
+        for k in sorted(self.recall_sum):
+            print('R@%i: %f' % (k, self.recall(k)))
@@ -1,4 +1,14 @@
 from datasets.vg_hdf5 import vg_hdf5
+from datasets.vg_memmap import vg_memmap
 
 def get_imdb(roidb_name, imdb_name, rpndb_name, split=-1, num_im=-1):
-    return vg_hdf5('%s.h5'%roidb_name, '%s-dicts.json'%roidb_name, imdb_name, rpndb_name, split=split, num_im=num_im)
+    # imdb_<size>.raw: raw image store (see datasets/vg_memmap.py)
+    # imdb_<size>.jpg.h5: index of the JPEG files (see datasets/vg_jpeg.py)
+    if imdb_name.endswith('.raw'):
+        imdb_class = vg_memmap
+    elif imdb_name.endswith('.jpg.h5'):
+        from datasets.vg_jpeg import vg_jpeg # needs PIL
+        imdb_class = vg_jpeg
+    else:
+        imdb_class = vg_hdf5
+    return imdb_class('%s.h5'%roidb_name, '%s-dicts.json'%roidb_name, imdb_name, rpndb_name, split=split, num_im=num_im)
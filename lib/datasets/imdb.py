@@ -99,6 +99,20 @@ class imdb(object):
             gt_roidb[i]['roi_scores'] = np.hstack([gt_roidb[i]['roi_scores'], rpn_roidb[i]['roi_scores']])
         return gt_roidb
 
+    def share_memory(self):
+        """
+        Prepare the roidb to be read by forked data workers. Datasets that
+        hold their roidb in NumPy arrays move them to shared memory.
+        """
+        pass
+
+    def prefetch_images(self, inds):
+        """
+        Hint that the images inds (see im_getter) are read soon. Datasets
+        that decode images in the background start decoding them.
+        """
+        pass
+
     def append_flipped_images(self):
         num_images = self.num_images
         widths = self._get_widths()
@@ -0,0 +1,171 @@
+"""
+Append-only HDF5 files of the top-scoring triplets predicted for each test
+image, so that the predictions can be evaluated again (tools/eval_dump.py)
+without running the network.
+
+Layout: one group per evaluation mode and inference iteration
+(<mode>/iter<n>) that holds
+
+    triplets (N, 3) int32: (subject class, predicate, object class)
+    boxes (N, 8) int32: subject and object boxes
+    scores (N,) float32 or float16: triplet scores
+    im_inds (M,): image index of each entry
+    first (M,), count (M,): triplet range of each entry
+    num_relations (M,): number of triplets predicted for the image
+        (before cutting them to the top_k of the file)
+
+The triplets of an image are sorted by score (see sg_eval.relation_triplets).
+"""
+
+import h5py
+import numpy as np
+
+# chunk length (rows) of the triplet and index datasets
+_CHUNK_ROWS = 4096
+
+_TRIPLET_DATASETS = [('triplets', (3,), np.int32),
+                     ('boxes', (8,), np.int32),
+                     ('scores', (), np.float32)]
+
+_INDEX_DATASETS = [('im_inds', np.int64),
+                   ('first', np.int64),
+                   ('count', np.int32),
+                   ('num_relations', np.int32)]
+
+
+def _group_name(mode, iter_n):
+    return '%s/iter%i' % (mode, iter_n)
+
+
+def _append(dset, rows):
+    n = dset.shape[0]
+    dset.resize(n + rows.shape[0], axis=0)
+    dset[n:] = rows
+
+
+class PredictionWriter(object):
+    """
+    Stream the predicted triplets of each image into an HDF5 file
+    """
+
+    def __init__(self, filename, top_k, sizes=None, score_dtype=np.float32):
+        """
+        top_k: number of triplets kept for each image (<= 0: all)
+        sizes: if given, append to an existing file after cutting it back
+            to these sizes (see checkpoint), e.g. to resume an interrupted
+            test run
+        score_dtype: data type of the stored triplet scores
+        """
+        self._score_dtype = np.dtype(score_dtype)
+        if sizes is None:
+            self._f = h5py.File(filename, 'w')
+            self._f.attrs['top_k'] = top_k
+        else:
+            self._f = h5py.File(filename, 'a')
+            assert(int(self._f.attrs['top_k']) == top_k)
+            self._truncate(sizes)
+        self.top_k = top_k
+
+    def _groups(self):
+        return ['%s/%s' % (mode, name) for mode in self._f
+                for name in self._f[mode]]
+
+    def _truncate(self, sizes):
+        # drop whatever was written after the sizes were recorded
+        for name in self._groups():
+            g = self._f[name]
+            num_entries, num_triplets = sizes.get(name, (0, 0))
+            for key, _, _ in _TRIPLET_DATASETS:
+                g[key].resize(num_triplets, axis=0)
+            for key, _ in _INDEX_DATASETS:
+                g[key].resize(num_entries, axis=0)
+
+    def checkpoint(self):
+        """
+        flush the file and return its sizes, from which a writer can
+        continue (see __init__)
+        """
+        self._f.flush()
+        sizes = {}
+        for name in self._groups():
+            g = self._f[name]
+            sizes[name] = (g['im_inds'].shape[0], g['triplets'].shape[0])
+        return sizes
+
+    def _group(self, mode, iter_n):
+        name = _group_name(mode, iter_n)
+        if name in self._f:
+            return self._f[name]
+        g = self._f.create_group(name)
+        for key, shape, dtype in _TRIPLET_DATASETS:
+            if key == 'scores':
+                dtype = self._score_dtype
+            g.create_dataset(key, shape=(0,) + shape, maxshape=(None,) + shape,
+                             dtype=dtype, chunks=(_CHUNK_ROWS,) + shape,
+                             compression='gzip', shuffle=True)
+        for key, dtype in _INDEX_DATASETS:
+            g.create_dataset(key, shape=(0,), maxshape=(None,), dtype=dtype,
+                             chunks=(_CHUNK_ROWS,))
+        return g
+
+    def write(self, mode, iter_n, im_idx, triplets, boxes, scores):
+        """
+        append the sorted triplets, triplet boxes and scores of an image
+        """
+        num_relations = triplets.shape[0]
+        if self.top_k > 0:
+            triplets = triplets[:self.top_k]
+            boxes = boxes[:self.top_k]
+            scores = scores[:self.top_k]
+        g = self._group(mode, iter_n)
+        first = g['triplets'].shape[0]
+        _append(g['triplets'], triplets.astype(np.int32))
+        _append(g['boxes'], boxes.astype(np.int32))
+        _append(g['scores'], scores.astype(g['scores'].dtype))
+        index = {'im_inds': im_idx, 'first': first,
+                 'count': triplets.shape[0], 'num_relations': num_relations}
+        for key, dtype in _INDEX_DATASETS:
+            _append(g[key], np.array([index[key]], dtype=dtype))
+
+    def close(self):
+        self._f.close()
+
+
+class PredictionReader(object):
+    """
+    Read the predictions written by PredictionWriter
+    """
+
+    def __init__(self, filename):
+        self._f = h5py.File(filename, 'r')
+        self.top_k = int(self._f.attrs['top_k'])
+
+    def groups(self):
+        """
+        (mode, inference iteration) of all groups in the file
+        """
+        groups = []
+        for mode in self._f:
+            for name in self._f[mode]:
+                groups.append((str(mode), int(name[len('iter'):])))
+        return sorted(groups)
+
+    def entries(self, mode, iter_n):
+        """
+        iterate over the images of a group, yield (im_idx, triplets, boxes,
+        scores, num_relations)
+        """
+        g = self._f[_group_name(mode, iter_n)]
+        # a group is small enough to be read at once, which is much faster
+        # than reading the triplets of every image from the file
+        data = dict([(key, g[key][...]) for key, _, _ in _TRIPLET_DATASETS])
+        index = dict([(key, g[key][...]) for key, _ in _INDEX_DATASETS])
+        for i in xrange(index['im_inds'].shape[0]):
+            first = index['first'][i]
+            last = first + index['count'][i]
+            yield (int(index['im_inds'][i]), data['triplets'][first:last],
+                   data['boxes'][first:last], data['scores'][first:last],
+                   int(index['num_relations'][i]))
+
+    def close(self):
+        self._f.close()
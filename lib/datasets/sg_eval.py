@@ -6,51 +6,37 @@ def eval_relation_recall(sg_entry,
                          mode,
                          iou_thresh):
 
-    # gt
-    gt_inds = np.where(roidb_entry['max_overlaps'] == 1)[0]
-    gt_boxes = roidb_entry['boxes'][gt_inds].copy().astype(float)
+    if roidb_entry['gt_relations'].shape[0] == 0:
+        return (None, None)
+    pred_triplets, pred_triplet_boxes, _ = \
+        relation_triplets(sg_entry, roidb_entry, mode)
+    eval_triplet_recall(pred_triplets, pred_triplet_boxes, roidb_entry,
+                        result_dict, mode, iou_thresh)
+
+    # for visualization
+    return pred_triplets, pred_triplet_boxes
+
+
+def relation_triplets(sg_entry, roidb_entry, mode):
+
+    # format the predictions of an image into triplets, triplet boxes and
+    # triplet scores, sorted by score (highest first)
+
+    gt_boxes = _gt_boxes(roidb_entry)
     num_gt_boxes = gt_boxes.shape[0]
-    gt_relations = roidb_entry['gt_relations'].copy()
     gt_classes = roidb_entry['gt_classes'].copy()
-
-    num_gt_relations = gt_relations.shape[0]
-    if num_gt_relations == 0:
-        return (None, None)
     gt_class_scores = np.ones(num_gt_boxes)
-    gt_predicate_scores = np.ones(num_gt_relations)
-    gt_triplets, gt_triplet_boxes, _ = _triplet(gt_relations[:,2],
-                                             gt_relations[:,:2],
-                                             gt_classes,
-                                             gt_boxes,
-                                             gt_predicate_scores,
-                                             gt_class_scores)
 
-    # pred
     box_preds = sg_entry['boxes']
     num_boxes = box_preds.shape[0]
-    predicate_preds = sg_entry['relations']
     class_preds = sg_entry['scores']
-    predicate_preds = predicate_preds.reshape(num_boxes, num_boxes, -1)
-
-    # no bg
-    predicate_preds = predicate_preds[:, :, 1:]
-    predicates = np.argmax(predicate_preds, 2).ravel() + 1
-    predicate_scores = predicate_preds.max(axis=2).ravel()
-    relations = []
-    keep = []
-    for i in xrange(num_boxes):
-        for j in xrange(num_boxes):
-            if i != j:
-                keep.append(num_boxes*i + j)
-                relations.append([i, j])
-    # take out self relations
-    predicates = predicates[keep]
-    predicate_scores = predicate_scores[keep]
-
-    relations = np.array(relations)
-    assert(relations.shape[0] == num_boxes * (num_boxes - 1))
+
+    # predicate scores of the relations in the test graph
+    relations = sg_entry['rel_inds']
+    predicate_preds = sg_entry['rel_scores'][:, 1:] # no bg
+    predicates = np.argmax(predicate_preds, 1) + 1
+    predicate_scores = predicate_preds.max(axis=1)
     assert(predicates.shape[0] == relations.shape[0])
-    num_relations = relations.shape[0]
 
     if mode =='pred_cls':
         # if predicate classification task
@@ -71,10 +57,7 @@ def eval_relation_recall(sg_entry,
         # use preicted boxes and predicted classes
         classes = np.argmax(class_preds, 1)
         class_scores = class_preds.max(axis=1)
-        boxes = []
-        for i, c in enumerate(classes):
-            boxes.append(box_preds[i, c*4:(c+1)*4])
-        boxes = np.vstack(boxes)
+        boxes = box_preds.reshape(num_boxes, -1, 4)[np.arange(num_boxes), classes]
     else:
         raise NotImplementedError('Incorrect Mode! %s' % mode)
 
@@ -82,21 +65,57 @@ def eval_relation_recall(sg_entry,
         _triplet(predicates, relations, classes, boxes,
                  predicate_scores, class_scores)
 
-
     sorted_inds = np.argsort(relation_scores)[::-1]
-    # compue recall
+    return (pred_triplets[sorted_inds, :], pred_triplet_boxes[sorted_inds, :],
+            relation_scores[sorted_inds])
+
+
+def eval_triplet_recall(pred_triplets,
+                        pred_triplet_boxes,
+                        roidb_entry,
+                        result_dict,
+                        mode,
+                        iou_thresh):
+
+    # add the R@K of an image to result_dict given its predicted triplets
+    # sorted by score (see relation_triplets). The predictions may be cut
+    # to the top K, which gives a lower bound of R@K for larger K.
+    # Returns False if the image has no gt relations.
+
+    # gt
+    gt_boxes = _gt_boxes(roidb_entry)
+    num_gt_boxes = gt_boxes.shape[0]
+    gt_relations = roidb_entry['gt_relations'].copy()
+    gt_classes = roidb_entry['gt_classes'].copy()
+
+    num_gt_relations = gt_relations.shape[0]
+    if num_gt_relations == 0:
+        return False
+    gt_class_scores = np.ones(num_gt_boxes)
+    gt_predicate_scores = np.ones(num_gt_relations)
+    gt_triplets, gt_triplet_boxes, _ = _triplet(gt_relations[:,2],
+                                             gt_relations[:,:2],
+                                             gt_classes,
+                                             gt_boxes,
+                                             gt_predicate_scores,
+                                             gt_class_scores)
+
+    # compute recall: the rank of the first prediction that matches a gt
+    # triplet gives R@K for every K at once
+    match_ranks = _match_ranks(gt_triplets,
+                               pred_triplets,
+                               gt_triplet_boxes,
+                               pred_triplet_boxes,
+                               iou_thresh)
     for k in result_dict[mode + '_recall']:
-        this_k = min(k, num_relations)
-        keep_inds = sorted_inds[:this_k]
-        recall = _relation_recall(gt_triplets,
-                                  pred_triplets[keep_inds,:],
-                                  gt_triplet_boxes,
-                                  pred_triplet_boxes[keep_inds,:],
-                                  iou_thresh)
+        recall = float(np.sum(match_ranks < k)) / float(num_gt_relations)
         result_dict[mode + '_recall'][k].append(recall)
+    return True
 
-    # for visualization
-    return pred_triplets[sorted_inds, :], pred_triplet_boxes[sorted_inds, :]
+
+def _gt_boxes(roidb_entry):
+    gt_inds = np.where(roidb_entry['max_overlaps'] == 1)[0]
+    return roidb_entry['boxes'][gt_inds].copy().astype(float)
 
 
 def _triplet(predicates, relations, classes, boxes,
@@ -104,52 +123,55 @@ def _triplet(predicates, relations, classes, boxes,
 
     # format predictions into triplets
     assert(predicates.shape[0] == relations.shape[0])
-    num_relations = relations.shape[0]
-    triplets = np.zeros([num_relations, 3]).astype(np.int32)
-    triplet_boxes = np.zeros([num_relations, 8]).astype(np.int32)
-    triplet_scores = np.zeros([num_relations]).astype(np.float32)
-    for i in xrange(num_relations):
-        triplets[i, 1] = predicates[i]
-        sub_i, obj_i = relations[i,:2]
-        triplets[i, 0] = classes[sub_i]
-        triplets[i, 2] = classes[obj_i]
-        triplet_boxes[i, :4] = boxes[sub_i, :]
-        triplet_boxes[i, 4:] = boxes[obj_i, :]
-        # compute triplet score
-        score =  class_scores[sub_i]
-        score *= class_scores[obj_i]
-        score *= predicate_scores[i]
-        triplet_scores[i] = score
+    sub_inds = relations[:, 0]
+    obj_inds = relations[:, 1]
+    triplets = np.vstack([classes[sub_inds], predicates,
+                          classes[obj_inds]]).T.astype(np.int32)
+    triplet_boxes = np.hstack([boxes[sub_inds], boxes[obj_inds]]).astype(np.int32)
+    # compute triplet score, in float64 whatever the precision of the
+    # predicted scores
+    triplet_scores = (class_scores[sub_inds].astype(np.float64) *
+                      class_scores[obj_inds] *
+                      predicate_scores).astype(np.float32)
     return triplets, triplet_boxes, triplet_scores
 
 
-def _relation_recall(gt_triplets, pred_triplets,
-                     gt_boxes, pred_boxes, iou_thresh):
+def _triplet_keys(triplets, base):
+    # encode (subject, predicate, object) triplets as integers
+    triplets = triplets.astype(np.int64)
+    return (triplets[:, 0] * base + triplets[:, 1]) * base + triplets[:, 2]
+
 
-    # compute the R@K metric for a set of predicted triplets
+def _match_ranks(gt_triplets, pred_triplets,
+                 gt_boxes, pred_boxes, iou_thresh):
+
+    # rank of the first (sorted) prediction that matches each gt triplet,
+    # inf if none does. R@K is the fraction of gt triplets with a rank
+    # below K.
 
     num_gt = gt_triplets.shape[0]
-    num_correct_pred_gt = 0
-
-    for gt, gt_box in zip(gt_triplets, gt_boxes):
-        keep = np.zeros(pred_triplets.shape[0]).astype(bool)
-        for i, pred in enumerate(pred_triplets):
-            if gt[0] == pred[0] and gt[1] == pred[1] and gt[2] == pred[2]:
-                keep[i] = True
-        if not np.any(keep):
-            continue
-        boxes = pred_boxes[keep,:]
-        sub_iou = iou(gt_box[:4], boxes[:,:4])
-        obj_iou = iou(gt_box[4:], boxes[:,4:])
-        inds = np.intersect1d(np.where(sub_iou >= iou_thresh)[0],
-                              np.where(obj_iou >= iou_thresh)[0])
-        if inds.size > 0:
-            num_correct_pred_gt += 1
-    return float(num_correct_pred_gt) / float(num_gt)
+    ranks = np.full(num_gt, np.inf)
+    if pred_triplets.shape[0] == 0:
+        return ranks
+
+    # (gt, pred) pairs with the same triplet
+    base = max(gt_triplets.max(), pred_triplets.max()) + 1
+    gt_keys = _triplet_keys(gt_triplets, base)
+    pred_keys = _triplet_keys(pred_triplets, base)
+    gt_inds, pred_inds = np.where(gt_keys[:, np.newaxis] == pred_keys[np.newaxis, :])
+
+    # a gt triplet is matched by a prediction if both their boxes overlap
+    sub_iou = iou(gt_boxes[gt_inds, :4], pred_boxes[pred_inds, :4])
+    obj_iou = iou(gt_boxes[gt_inds, 4:], pred_boxes[pred_inds, 4:])
+    hit = np.logical_and(sub_iou >= iou_thresh, obj_iou >= iou_thresh)
+    np.minimum.at(ranks, gt_inds[hit], pred_inds[hit])
+    return ranks
 
 
 def iou(gt_box, pred_boxes):
-    # computer Intersection-over-Union between two sets of boxes
+    # computer Intersection-over-Union between a box and a set of boxes, or
+    # between two sets of boxes (elementwise)
+    gt_box = gt_box.T
     ixmin = np.maximum(gt_box[0], pred_boxes[:,0])
     iymin = np.maximum(gt_box[1], pred_boxes[:,1])
     ixmax = np.minimum(gt_box[2], pred_boxes[:,2])
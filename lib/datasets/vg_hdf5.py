@@ -1,24 +1,26 @@
 import os
 from datasets.imdb import imdb
+from datasets.columnar_roidb import ColumnarRoidb
 import numpy as np
 import copy
-import scipy.sparse
 import h5py, json
+import hashlib
 from fast_rcnn.config import cfg
+from utils.shared_mem import share_array, memmap_h5_dataset
 
 class vg_hdf5(imdb):
     def __init__(self, roidb_file, dict_file, imdb_file, rpndb_file, split, num_im):
         imdb.__init__(self, roidb_file[:-3])
 
+        self._image_db_version = None
+
         # read in dataset from a h5 file and a dict (json) file
-        self.im_h5 = h5py.File(os.path.join(cfg.VG_DIR, imdb_file), 'r')
+        im_scale = self._open_images(os.path.join(cfg.VG_DIR, imdb_file))
         self.roi_h5 = h5py.File(os.path.join(cfg.VG_DIR, roidb_file), 'r')
 
         # roidb metadata
         self.info = json.load(open(os.path.join(cfg.VG_DIR,
                                                 dict_file), 'r'))
-        self.im_refs = self.im_h5['images'] # image data reference
-        im_scale = self.im_refs.shape[2]
 
         print('split==%i' % split)
         data_split = self.roi_h5['split'][:]
@@ -89,61 +91,78 @@ class vg_hdf5(imdb):
         # Default to roidb handler
         self._roidb_handler = self.gt_roidb
 
+    def _open_images(self, imdb_path):
+        """
+        open the image database, set self.im_h5 (which holds the image
+        sizes) and return the long side of the images
+        """
+        h5_cache = {}
+        if cfg.IMDB_CHUNK_CACHE_MB >= 0:
+            h5_cache['rdcc_nbytes'] = cfg.IMDB_CHUNK_CACHE_MB * 1024 ** 2
+        self.im_h5 = h5py.File(imdb_path, 'r', **h5_cache)
+        self.im_refs = self.im_h5['images'] # image data reference
+        return self.im_refs.shape[2]
+
+    def image_db_version(self):
+        """
+        a fingerprint of the image database (the ids and sizes of all of its
+        images), the same for every split and for all image formats
+        """
+        if self._image_db_version is None:
+            md5 = hashlib.md5()
+            for name in ['image_ids', 'image_heights', 'image_widths']:
+                md5.update(np.ascontiguousarray(self.im_h5[name][:], dtype=np.int64).tobytes())
+            self._image_db_version = md5.hexdigest()[:16]
+        return self._image_db_version
+
     def im_getter(self, idx):
         w, h = self.im_sizes[idx, :]
         ridx = self.image_index[idx]
-        im = self.im_refs[ridx]
-        im = im[:, :h, :w] # crop out
-        im = im.transpose((1,2,0)) # c h w -> h w c
-        return im
+        # read only the image, not the padding around it
+        im = self.im_refs[ridx, :, :h, :w]
+        return im.transpose((1,2,0)) # c h w -> h w c (a view)
 
     def gt_roidb(self):
         """
         Return the database of ground-truth regions of interest.
         """
-        gt_roidb = []
-        for i in range(self.num_images):
-            assert(self.im_to_first_box[i] >= 0)
-            boxes = self.all_boxes[self.im_to_first_box[i]
-                                   :self.im_to_last_box[i]+1,:]
-
-            gt_classes = self.labels[self.im_to_first_box[i]
-                                     :self.im_to_last_box[i]+1]
-
-            overlaps = np.zeros((boxes.shape[0], self.num_classes))
-            for j, o in enumerate(overlaps): # to one-hot
-                #if gt_classes[j] > 0: # consider negative sample
-                o[gt_classes[j]] = 1.0
-            overlaps = scipy.sparse.csr_matrix(overlaps)
-
-            # make ground-truth relations
-            gt_relations = []
-            if self.im_to_first_rel[i] >= 0: # if image has relations
-                predicates = self._relation_predicates[self.im_to_first_rel[i]
-                                             :self.im_to_last_rel[i]+1]
-                obj_idx = self._relations[self.im_to_first_rel[i]
-                                             :self.im_to_last_rel[i]+1]
-                obj_idx = obj_idx - self.im_to_first_box[i]
-                assert(np.all(obj_idx>=0) and np.all(obj_idx<boxes.shape[0])) # sanity check
-                for j, p in enumerate(predicates):
-                    gt_relations.append([obj_idx[j][0], obj_idx[j][1], p])
-
-            gt_relations = np.array(gt_relations)
-
-            seg_areas = np.multiply((boxes[:, 2] - boxes[:, 0] + 1),
-                                    (boxes[:, 3] - boxes[:, 1] + 1)) # box areas
-            gt_roidb.append({'boxes': boxes,
-                             'gt_classes' : gt_classes,
-                             'gt_overlaps' : overlaps,
-                             'gt_relations': gt_relations,
-                             'flipped' : False,
-                             'seg_areas' : seg_areas,
-                             'db_idx': i,
-                             'image': lambda im_i=i: self.im_getter(im_i),
-                             'roi_scores': np.ones(boxes.shape[0]),
-                             'width': self.im_sizes[i][0],
-                             'height': self.im_sizes[i][1]})
-        return gt_roidb
+        return ColumnarRoidb(self.all_boxes, self.labels,
+                             self.im_to_first_box, self.im_to_last_box,
+                             self._relations, self._relation_predicates,
+                             self.im_to_first_rel, self.im_to_last_rel,
+                             self.im_sizes, self.num_classes, self.im_getter)
+
+    def append_flipped_images(self):
+        self.roidb.append_flipped()
+        self._image_index = np.hstack([self._image_index,
+                                       self._image_index]).transpose()
+        self.im_sizes = np.vstack([self.im_sizes,
+                                   self.im_sizes])
+
+    def share_memory(self):
+        """
+        Move the roidb arrays and the RPN proposal index to memory that
+        forked data workers read without copying. The RPN proposals are
+        memory-mapped from the h5 file if its layout allows.
+        """
+        memo = {}
+        for name in ['all_boxes', 'labels', 'im_to_first_box', 'im_to_last_box',
+                     '_relations', '_relation_predicates', 'im_to_first_rel',
+                     'im_to_last_rel', 'im_sizes', '_image_index']:
+            setattr(self, name, share_array(getattr(self, name), memo))
+        if self._roidb is not None:
+            self._roidb.share_memory(memo)
+
+        if cfg.TRAIN.USE_RPN_DB:
+            self.rpn_im_to_roi_idx = share_array(self.rpn_im_to_roi_idx)
+            self.rpn_num_rois = share_array(self.rpn_num_rois)
+            rpn_rois = memmap_h5_dataset(self.rpn_h5['rpn_rois'])
+            rpn_scores = memmap_h5_dataset(self.rpn_h5['rpn_scores'])
+            if rpn_rois is not None and rpn_scores is not None:
+                self.rpn_rois = rpn_rois
+                self.rpn_scores = rpn_scores
+            else:
+                print('RPN proposals are not contiguous in %s, reading them through h5py' % self.rpn_h5_fn)
 
     def add_rpn_rois(self, gt_roidb_batch, make_copy=True):
         """
@@ -0,0 +1,82 @@
+import os
+import numpy as np
+import h5py
+from multiprocessing.pool import ThreadPool
+from PIL import Image
+from datasets.vg_hdf5 import vg_hdf5
+from fast_rcnn.config import cfg
+from utils.shared_mem import SharedLRUCache
+
+class vg_jpeg(vg_hdf5):
+    """
+    VG read from the original JPEG files in cfg.VG_IMAGE_DIR. The image
+    index (ids and sizes, no pixels) is written by data_tools/vg_to_imdb.py
+    --format jpeg to imdb_<size>.jpg.h5. The images are decoded and resized
+    to the sizes of the index exactly like vg_to_imdb.py does, so they are
+    the same as those of imdb_<size>.h5.
+
+    Images are decoded by a pool of cfg.JPEG_DECODE_THREADS threads in each
+    process (see prefetch_images) and kept in an LRU cache of
+    cfg.JPEG_CACHE_MB megabytes that forked data workers share.
+    """
+
+    def _open_images(self, imdb_path):
+        self.im_h5 = h5py.File(imdb_path, 'r')
+        self.im_ids = self.im_h5['image_ids'][:]
+        self._pool = None
+        self._pool_pid = None
+        self._pending = {}
+        self._cache = None
+        if cfg.JPEG_CACHE_MB > 0:
+            self._cache = SharedLRUCache(self.im_ids.shape[0],
+                                         cfg.JPEG_CACHE_MB * 1024 ** 2)
+        return int(self.im_h5.attrs['image_size'])
+
+    def _decode(self, ridx, w, h):
+        im = Image.open(os.path.join(cfg.VG_IMAGE_DIR, '%i.jpg' % self.im_ids[ridx]))
+        if im.mode != 'RGB':
+            im = im.convert('RGB')
+        im = im.resize((w, h), Image.BILINEAR)
+        im = np.ascontiguousarray(np.asarray(im)[:, :, ::-1]) # rgb -> bgr
+        if self._cache is not None:
+            self._cache.put(ridx, im)
+        return im
+
+    def _get_pool(self):
+        # threads do not survive a fork, each process starts its own pool
+        if self._pool_pid != os.getpid():
+            self._pool = ThreadPool(max(cfg.JPEG_DECODE_THREADS, 1))
+            self._pool_pid = os.getpid()
+            self._pending = {}
+        return self._pool
+
+    def prefetch_images(self, inds):
+        """
+        start decoding the images inds in the background. Images of an
+        earlier call that were not read (im_getter) are dropped, so only
+        the images of the last call are kept pending.
+        """
+        pool = self._get_pool()
+        pending = {}
+        for idx in inds:
+            ridx = self.image_index[idx]
+            if ridx in self._pending:
+                pending[ridx] = self._pending[ridx]
+                continue
+            if self._cache is not None and ridx in self._cache:
+                continue
+            w, h = self.im_sizes[idx, :]
+            pending[ridx] = pool.apply_async(self._decode, (ridx, w, h))
+        self._pending = pending
+
+    def im_getter(self, idx):
+        w, h = self.im_sizes[idx, :]
+        ridx = self.image_index[idx]
+        self._get_pool()
+        if ridx in self._pending:
+            return self._pending.pop(ridx).get()
+        if self._cache is not None:
+            im = self._cache.get(ridx)
+            if im is not None:
+                return im
+        return self._decode(ridx, w, h)
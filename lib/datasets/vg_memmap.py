@@ -0,0 +1,26 @@
+import numpy as np
+import h5py
+from datasets.vg_hdf5 import vg_hdf5
+
+class vg_memmap(vg_hdf5):
+    """
+    VG with the images in a raw image store, written by
+    data_tools/vg_to_imdb.py --format raw: imdb_<size>.raw holds the BGR
+    images tightly packed (H x W x 3 each, no padding), imdb_<size>.raw.h5
+    their offsets and sizes. An image is one contiguous slice of the
+    memory-mapped store, which forked data workers share.
+    """
+
+    def _open_images(self, imdb_path):
+        self.im_h5 = h5py.File(imdb_path + '.h5', 'r')
+        self.im_offsets = self.im_h5['image_offsets'][:]
+        self.im_data = np.memmap(imdb_path, dtype=np.uint8, mode='r')
+        return int(self.im_h5.attrs['image_size'])
+
+    def im_getter(self, idx):
+        """
+        return the image as a read-only (H, W, 3) view of the store
+        """
+        w, h = self.im_sizes[idx, :]
+        start = self.im_offsets[self.image_index[idx]]
+        return self.im_data[start:start + h * w * 3].reshape(h, w, 3)
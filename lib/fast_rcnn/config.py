@@ -102,6 +102,24 @@ __C.TRAIN.ASPECT_GROUPING = True
 # Use RPN to detect objects
 __C.TRAIN.USE_RPN_DB = True
 
+# Number of data loading processes (<= 0: one per CPU core)
+__C.TRAIN.NUM_DATA_WORKERS = 3
+
+# Pass minibatches from the data workers through this many shared memory
+# slots of SHM_SLOT_MB megabytes each instead of pickling them (0 to disable)
+__C.TRAIN.SHM_BATCH_SLOTS = 8
+__C.TRAIN.SHM_SLOT_MB = 32
+
+# Train on conv5_3 feature maps precomputed by tools/extract_conv_features.py
+# instead of running the (frozen) VGG trunk in every iteration
+__C.TRAIN.USE_CONV_CACHE = False
+__C.TRAIN.CONV_CACHE_DIR = ''
+
+# Read the training images resized to TRAIN.SCALES (as uint8) from the cache
+# built by tools/build_scale_cache.py in this directory ('' to disable).
+# Images and scales that are not in the cache are resized on the fly.
+__C.TRAIN.SCALE_CACHE_DIR = ''
+
 # Testing options
 #
 
@@ -114,6 +132,45 @@ __C.TEST.SCALES = (600,)
 # Max pixel size of the longest side of a scaled input image
 __C.TEST.MAX_SIZE = 1000
 
+# Evaluate the predictions of every message passing iteration (from the
+# same run of the network) instead of only the last one
+__C.TEST.EVAL_ALL_ITERS = False
+
+# Report the triplet recall at these K (R@K). All K are computed from one
+# ranking of the predictions, so adding K values costs nothing.
+__C.TEST.RECALL_K = (20, 50, 100)
+
+# Number of top-scoring triplets of each image written to a prediction dump
+# (test_net --dump, see datasets/pred_dump.py), <= 0 for all. R@K can be
+# recomputed from a dump (tools/eval_dump.py) for K up to this number.
+__C.TEST.DUMP_TOP_K = 500
+
+# Data type of the class and predicate scores returned by im_detect, and of
+# the triplet scores written to a prediction dump. float64 is the original
+# precision (see SOFTMAX_DTYPE); 'float32' or 'float16' are not validated
+# on mini-vg yet.
+__C.TEST.PRED_DTYPE = 'float64'
+__C.TEST.DUMP_SCORE_DTYPE = 'float32'
+
+# Save the evaluation state of test_net every CKPT_FREQ images when it is
+# given a checkpoint (--ckpt_dir in tools/test_net.py)
+__C.TEST.CKPT_FREQ = 500
+
+# Number of TensorFlow threads of each test_net_sharded process (<= 0: the
+# CPU cores split evenly between the processes)
+__C.TEST.SHARD_THREADS = 0
+
+# Ranks of the truncated SVD fc6 (and rel_fc6) and fc7 (and rel_fc7) layers
+# of the *_svd networks, 0 for an uncompressed layer. No ranks have been
+# chosen yet: pick them with tools/svd_rank_sweep.py, and pass the config
+# written by tools/compress_fc.py next to the compressed checkpoint.
+__C.TEST.SVD_FC6_RANK = 0
+__C.TEST.SVD_FC7_RANK = 0
+
+# Number of images per run of the network in test_net (requires a single
+# test scale)
+__C.TEST.IMS_PER_BATCH = 1
+
 # Overlap threshold used for non-maximum suppression (suppress boxes with
 # IoU >= this threshold)
 __C.TEST.PROPOSAL_NMS = 0.3
@@ -130,6 +187,15 @@ __C.TEST.HAS_RPN = False
 
 # Use RPN Database
 __C.TEST.USE_RPN_DB = True
+
+# Relation candidates of the test graph (sg_det): drop pairs of proposals
+# whose gap exceeds REL_PAIR_MAX_GAP (the gap between two boxes relative to
+# their union box, in [0, 1)) and keep at most REL_PAIR_BUDGET relations
+# (both directions of the pairs with the highest product of proposal
+# scores, so at least 2). -1 disables either filter. Images whose candidates
+# are all dropped have no predictions (R@K 0).
+__C.TEST.REL_PAIR_MAX_GAP = -1.
+__C.TEST.REL_PAIR_BUDGET = -1
 #
 # MISC
 #
@@ -146,6 +212,29 @@ __C.DEDUP_BOXES = 1./16.
 # they were trained with
 __C.PIXEL_MEANS = np.array([[[102.9801, 115.9465, 122.7717]]])
 
+# Compute the union boxes of the relations and the message passing indices
+# in the TensorFlow graph from the rois and relations instead of feeding them
+__C.GRAPH_DATA_IN_TF = False
+
+# Compute the union box features of a relation (i, j) and its reverse (j, i)
+# only once. The features of both directions also share a dropout mask
+# during training.
+__C.SHARE_UNION_FEATS = False
+
+# Bilinear image resizing of the training and test preprocessing:
+#   'scipy': scipy.ndimage.zoom (the reference)
+#   'numpy': a separable NumPy version of it, same output up to float
+#       rounding (see tools/benchmark_resize.py) and several times faster
+#   'pil', 'cv2': PIL or OpenCV (if installed), which sample the pixels
+#       differently (and PIL antialiases when shrinking)
+__C.RESIZE_BACKEND = 'scipy'
+
+# Data type of the class and predicate softmax (cls_prob, rel_prob) of the
+# networks, in the training and the test graphs. float64 is the original
+# precision; compare the mini-vg R@20/50/100 of sg_cls and sg_det before
+# switching it (and TEST.PRED_DTYPE) to 'float32'.
+__C.SOFTMAX_DTYPE = 'float64'
+
 # For reproducibility
 __C.RNG_SEED = 3
 
@@ -161,6 +250,19 @@ __C.DATA_DIR = osp.abspath(osp.join(__C.ROOT_DIR, 'data'))
 
 __C.VG_DIR = osp.abspath(osp.join(__C.ROOT_DIR, 'data/vg/'))
 
+# Chunk cache of the image database file in megabytes (< 0: the h5py default
+# of 1MB). It only helps if the images are chunked and an image is read more
+# than once while its chunks are in the cache (see data_tools/repack_imdb.py)
+__C.IMDB_CHUNK_CACHE_MB = -1
+
+# Images read from the VG JPEG files (imdb_<size>.jpg.h5, see
+# datasets/vg_jpeg.py): directory of the files, number of decoding threads
+# of each process and size of the decoded image cache in megabytes that the
+# data workers share (0 to disable)
+__C.VG_IMAGE_DIR = osp.abspath(osp.join(__C.VG_DIR, 'images'))
+__C.JPEG_DECODE_THREADS = 4
+__C.JPEG_CACHE_MB = 4096
+
 
 # Default GPU device id
 __C.GPU_ID = 0
@@ -0,0 +1,68 @@
+# --------------------------------------------------------
+# Scene Graph Generation by Iterative Message Passing
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""
+Precompute the conv5_3 feature maps of the frozen VGG trunk
+"""
+
+import tensorflow as tf
+import numpy as np
+
+from fast_rcnn.config import cfg
+from networks.models import basenet
+from roi_data_layer.conv_cache import ConvFeatureCache
+from utils.blob import prep_im_for_blob, im_list_to_blob
+from utils.timer import Timer
+
+
+def extract_conv_features(weight_name, imdb, output_dir, dtype=np.float32):
+    """
+    Run the VGG trunk once per (image, training scale, flip) and write the
+    conv_out feature maps to a ConvFeatureCache in output_dir
+    """
+    ims = tf.placeholder(dtype=tf.float32, shape=[None, None, None, 3], name='ims')
+    rois = tf.placeholder(dtype=tf.float32, shape=[None, 5], name='rois')
+    net = basenet({'ims': ims, 'rois': rois})
+    net.layers = dict({'ims': ims, 'rois': rois})
+    net._vgg_conv()
+    conv_out = net.get_output('conv_out')
+
+    sess = tf.Session()
+    print ('Loading trunk weights from {:s}').format(weight_name)
+    if weight_name.endswith('.npy'):
+        net.load(weight_name, sess, ignore_missing=True)
+    elif weight_name.endswith('.ckpt'):
+        # restore the trunk variables only
+        saver = tf.train.Saver(tf.all_variables())
+        saver.restore(sess, weight_name)
+    else:
+        raise ValueError('Unsupported weights format: %s' % weight_name)
+
+    flips = [False, True] if cfg.TRAIN.USE_FLIPPED else [False]
+    cache = ConvFeatureCache(output_dir, mode='w', dtype=dtype,
+                             scales=cfg.TRAIN.SCALES,
+                             max_size=cfg.TRAIN.MAX_SIZE)
+
+    num_images = imdb.num_images
+    timer = Timer()
+    for im_i in xrange(num_images):
+        timer.tic()
+        im = imdb.im_getter(im_i)
+        for flipped in flips:
+            im_in = im[:, ::-1, :] if flipped else im
+            for scale_ind, target_size in enumerate(cfg.TRAIN.SCALES):
+                im_scaled, im_scale = prep_im_for_blob(im_in, cfg.PIXEL_MEANS,
+                                                       target_size,
+                                                       cfg.TRAIN.MAX_SIZE)
+                blob = im_list_to_blob([im_scaled])
+                feat = sess.run(conv_out, feed_dict={ims: blob})
+                cache.add(im_i, scale_ind, flipped, im_scale, feat[0])
+        timer.toc()
+        if (im_i + 1) % 100 == 0:
+            print 'extract: {:d}/{:d} {:.3f}s'.format(im_i + 1, num_images,
+                                                     timer.average_time)
+
+    cache.close()
+    print 'Wrote {:d} feature maps to {:s}'.format(len(cache), output_dir)
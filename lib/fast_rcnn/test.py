@@ -6,17 +6,19 @@
 
 from fast_rcnn.config import cfg
 from fast_rcnn.bbox_transform import clip_boxes, bbox_transform_inv
-from roi_data_layer.roidb import prepare_roidb
+from roi_data_layer.roidb import prepare_roidb, prepare_test_roidb_entry
 import roi_data_layer.data_utils as data_utils
 from datasets.evaluator import SceneGraphEvaluator
+from datasets.sg_eval import relation_triplets
+from datasets.pred_dump import PredictionWriter
 from networks.factory import get_network
 from utils.timer import Timer
 from utils.cpu_nms import cpu_nms
 import numpy as np
-import scipy.ndimage
 import tensorflow as tf
+import multiprocessing
 import os
-from utils.blob import im_list_to_blob
+from utils.blob import im_list_to_blob, resize_im
 
 """
 Test a scene graph generation network
@@ -33,6 +35,20 @@ def _get_image_blob(im):
         im_scale_factors (list): list of image scales (relative to im) used
             in the image pyramid
     """
+    processed_ims, im_scale_factors = _get_image_pyramid(im)
+
+    # Create a blob to hold the input images
+    blob = im_list_to_blob(processed_ims)
+
+    return blob, im_scale_factors
+
+def _get_image_pyramid(im):
+    """Mean subtract an image and rescale it to the test scales.
+
+    Returns:
+        processed_ims (list): the rescaled images
+        im_scale_factors (ndarray): the scale factors (relative to im)
+    """
     im_orig = im.astype(np.float32, copy=True)
     im_orig -= cfg.PIXEL_MEANS
 
@@ -49,14 +65,11 @@ def _get_image_blob(im):
         if np.round(im_scale * im_size_max) > cfg.TEST.MAX_SIZE:
             im_scale = float(cfg.TEST.MAX_SIZE) / float(im_size_max)
 
-        im = scipy.ndimage.interpolation.zoom(im_orig, (im_scale, im_scale, 1.0), order=1)
+        im = resize_im(im_orig, im_scale)
         im_scale_factors.append(im_scale)
         processed_ims.append(im)
 
-    # Create a blob to hold the input images
-    blob = im_list_to_blob(processed_ims)
-
-    return blob, np.array(im_scale_factors)
+    return processed_ims, np.array(im_scale_factors)
 
 def _get_rois_blob(im_rois, im_scale_factors):
     """Converts RoIs into network inputs.
@@ -107,62 +120,193 @@ def _get_blobs(im, rois):
     blobs['rois'] = _get_rois_blob(rois, im_scale_factors)
     return blobs, im_scale_factors
 
-def im_detect(sess, net, inputs, im, boxes, bbox_reg, multi_iter):
-    blobs, im_scales = _get_blobs(im, boxes)
+def _box_pair_gap(boxes_a, boxes_b):
+    """
+    gap between two boxes relative to their union box, 0 if they overlap
+    """
+    union_w = np.maximum(boxes_a[:, 2], boxes_b[:, 2]) - \
+              np.minimum(boxes_a[:, 0], boxes_b[:, 0]) + 1.
+    union_h = np.maximum(boxes_a[:, 3], boxes_b[:, 3]) - \
+              np.minimum(boxes_a[:, 1], boxes_b[:, 1]) + 1.
+    gap_w = np.maximum(np.maximum(boxes_a[:, 0], boxes_b[:, 0]) -
+                       np.minimum(boxes_a[:, 2], boxes_b[:, 2]) - 1., 0.)
+    gap_h = np.maximum(np.maximum(boxes_a[:, 1], boxes_b[:, 1]) -
+                       np.minimum(boxes_a[:, 3], boxes_b[:, 3]) - 1., 0.)
+    return np.maximum(gap_w / union_w, gap_h / union_h)
+
+def complete_graph(num_boxes):
+    """
+    Return the relations of the complete graph: all directed pairs of
+    distinct boxes, in row-major order
+    """
+    sub, obj = np.where(~np.eye(num_boxes, dtype=bool))
+    return np.vstack([sub, obj]).T.astype(np.int32)
+
+def rel_pair_candidates(boxes, scores=None):
+    """
+    Return the relations (directed pairs of boxes) of the test graph, all
+    pairs of distinct boxes unless pruned by cfg.TEST.REL_PAIR_MAX_GAP and
+    cfg.TEST.REL_PAIR_BUDGET. Pairs are ranked by the product of their box
+    scores and both directions of a pair are kept or dropped together.
+    """
+    num_boxes = boxes.shape[0]
+    sub, obj = np.triu_indices(num_boxes, k=1)
+
+    if cfg.TEST.REL_PAIR_MAX_GAP >= 0:
+        gap = _box_pair_gap(boxes[sub], boxes[obj])
+        keep = np.where(gap <= cfg.TEST.REL_PAIR_MAX_GAP)[0]
+        sub, obj = sub[keep], obj[keep]
+
+    assert cfg.TEST.REL_PAIR_BUDGET < 0 or cfg.TEST.REL_PAIR_BUDGET >= 2, \
+        'TEST.REL_PAIR_BUDGET must be -1 or at least 2 (both directions of a pair)'
+    max_pairs = cfg.TEST.REL_PAIR_BUDGET // 2
+    if cfg.TEST.REL_PAIR_BUDGET >= 0 and sub.shape[0] > max_pairs:
+        if scores is None:
+            scores = np.ones(num_boxes)
+        pair_scores = scores[sub] * scores[obj]
+        keep = np.argsort(-pair_scores, kind='mergesort')[:max_pairs]
+        sub, obj = sub[keep], obj[keep]
+
+    relations = np.vstack([np.hstack([sub, obj]), np.hstack([obj, sub])]).T
+    # row-major order, as the complete graph
+    order = np.lexsort((relations[:, 1], relations[:, 0]))
+    return relations[order].astype(np.int32)
+
+def im_detect(sess, net, inputs, im, boxes, bbox_reg, multi_iter, relations=None,
+              dense_relations=False):
+    """
+    relations: the relations (pairs of indices into boxes) of the graph, all
+    pairs of distinct boxes if None
+
+    Returns for each inference iteration in multi_iter a dict with the box
+    class scores and the boxes, the relations of the graph ('rel_inds') and
+    their predicate scores ('rel_scores'). With dense_relations, the
+    predicate scores are also returned as a (num_boxes x num_boxes x
+    num_predicates) array ('relations'), zero for the pairs that are not in
+    the graph.
+    """
+    return im_detect_batch(sess, net, inputs, [im], [boxes], bbox_reg,
+                           multi_iter, [relations],
+                           dense_relations=dense_relations)[0]
 
-    relations = []
-    for i in range(boxes.shape[0]):
-        for j in range(boxes.shape[0]):
-            if i != j:
-                relations.append([i, j])
-    relations = np.array(relations, dtype=np.int32) # all possible combinations
-    num_roi = blobs['rois'].shape[0]
-    num_rel = relations.shape[0]
+def im_detect_batch(sess, net, inputs, ims, boxes_list, bbox_reg, multi_iter,
+                    relations_list=None, blob_cache=None, dense_relations=False):
+    """
+    Detect scene graphs of several images in one run of the network. As in
+    get_minibatch, the images are packed into one blob and the graphs of the
+    images are concatenated, with the rois and relations offset accordingly.
+    An image may have no boxes, its output is then empty.
+
+    blob_cache: a dict that keeps the scale factors and the conv features of
+    the images between calls with the same images (and different boxes),
+    so that the conv layers only run in the first call
 
-    inputs_feed = data_utils.create_graph_data(num_roi, num_rel, relations)
+    Returns a list with the output of im_detect for each image.
+    """
+    assert len(cfg.TEST.SCALES) == 1 or len(ims) == 1, \
+        'Batched inference only supports a single test scale'
+    if relations_list is None:
+        relations_list = [None for _ in ims]
+    if blob_cache is None:
+        blob_cache = {}
+
+    if 'im_scales' not in blob_cache:
+        processed_ims = []
+        blob_cache['im_scales'] = []
+        for im in ims:
+            im_processed, im_scales = _get_image_pyramid(im)
+            processed_ims += im_processed
+            blob_cache['im_scales'].append(im_scales)
+        im_blob = im_list_to_blob(processed_ims)
+
+    rois_blob = []
+    relations_blob = []
+    image_relations = []
+    roi_offset = 0
+    for i, (boxes, relations) in enumerate(zip(boxes_list, relations_list)):
+        rois = _get_rois_blob(boxes, blob_cache['im_scales'][i])
+        rois[:, 0] += i # image index in the blob
+        if relations is None:
+            relations = complete_graph(boxes.shape[0])
+        rois_blob.append(rois)
+        relations_blob.append(relations + roi_offset)
+        image_relations.append(relations)
+        roi_offset += rois.shape[0]
+
+    rois_blob = np.vstack(rois_blob)
+    relations = np.vstack(relations_blob).astype(np.int32)
+    num_roi = rois_blob.shape[0]
+    num_rel = relations.shape[0]
 
-    feed_dict = {inputs['ims']: blobs['data'],
-                 inputs['rois']: blobs['rois'],
+    feed_dict = {inputs['rois']: rois_blob,
                  inputs['relations']: relations,
                  net.keep_prob: 1}
 
-    for k in inputs_feed:
-        feed_dict[inputs[k]] = inputs_feed[k]
+    ops = {}
+    if 'conv_out' in blob_cache:
+        # feed the cached conv features, the conv layers are not run
+        feed_dict[net.get_output('conv_out')] = blob_cache['conv_out']
+    else:
+        feed_dict[inputs['ims']] = im_blob
+        ops['conv_out'] = net.get_output('conv_out')
 
-    # compute relation rois
-    feed_dict[inputs['rel_rois']] = \
-        data_utils.compute_rel_rois(num_rel, blobs['rois'], relations)
+    if not cfg.GRAPH_DATA_IN_TF:
+        inputs_feed = data_utils.create_graph_data(num_roi, num_rel, relations)
+        for k in inputs_feed:
+            feed_dict[inputs[k]] = inputs_feed[k]
 
-    ops = {}
+        # compute relation rois
+        feed_dict[inputs['rel_rois']] = \
+            data_utils.compute_rel_rois(num_rel, rois_blob, relations)
 
     ops['bbox_deltas'] = net.bbox_pred_output(multi_iter)
     ops['rel_probs'] = net.rel_pred_output(multi_iter)
     ops['cls_probs'] = net.cls_pred_output(multi_iter)
 
     ops_value = sess.run(ops, feed_dict=feed_dict)
-
-    out_dict = {}
+    if 'conv_out' in ops_value:
+        blob_cache['conv_out'] = ops_value['conv_out']
+
+    # split the outputs into images
+    roi_splits = np.cumsum([b.shape[0] for b in boxes_list])[:-1]
+    rel_splits = np.cumsum([r.shape[0] for r in image_relations])[:-1]
+    out_dicts = [{} for _ in ims]
+    pred_dtype = np.dtype(cfg.TEST.PRED_DTYPE)
     for mi in multi_iter:
-        rel_probs = None
-        rel_probs_flat = ops_value['rel_probs'][mi]
-        rel_probs = np.zeros([num_roi, num_roi, rel_probs_flat.shape[1]])
-        for i, rel in enumerate(relations):
-            rel_probs[rel[0], rel[1], :] = rel_probs_flat[i, :]
-
-        cls_probs = ops_value['cls_probs'][mi]
-
-        if bbox_reg:
-            # Apply bounding-box regression deltas
-            pred_boxes = bbox_transform_inv(boxes, ops_value['bbox_deltas'][mi])
-            pred_boxes = clip_boxes(pred_boxes, im.shape)
-        else:
-            # Simply repeat the boxes, once for each class
-            pred_boxes = np.tile(boxes, (1, cls_probs.shape[1]))
-
-        out_dict[mi] = {'scores': cls_probs.copy(),
-                        'boxes': pred_boxes.copy(),
-                        'relations': rel_probs.copy()}
-    return out_dict
+        cls_probs = ops_value['cls_probs'][mi].astype(pred_dtype, copy=False)
+        rel_probs = ops_value['rel_probs'][mi].astype(pred_dtype, copy=False)
+        cls_probs_list = np.split(cls_probs, roi_splits)
+        bbox_deltas_list = np.split(ops_value['bbox_deltas'][mi], roi_splits)
+        rel_probs_list = np.split(rel_probs, rel_splits)
+        for i, out_dict in enumerate(out_dicts):
+            boxes = boxes_list[i]
+            relations = image_relations[i]
+            num_boxes = boxes.shape[0]
+            if num_boxes == 0:
+                continue
+            rel_probs_flat = rel_probs_list[i]
+            cls_probs = cls_probs_list[i]
+
+            if bbox_reg:
+                # Apply bounding-box regression deltas
+                pred_boxes = bbox_transform_inv(boxes, bbox_deltas_list[i])
+                pred_boxes = clip_boxes(pred_boxes, ims[i].shape)
+            else:
+                # Simply repeat the boxes, once for each class
+                pred_boxes = np.tile(boxes, (1, cls_probs.shape[1]))
+
+            # the outputs are views of the arrays returned by sess.run,
+            # which are not reused
+            out_dict[mi] = {'scores': cls_probs,
+                            'boxes': pred_boxes,
+                            'rel_inds': relations,
+                            'rel_scores': rel_probs_flat}
+            if dense_relations:
+                rel_probs_dense = np.zeros([num_boxes, num_boxes, rel_probs_flat.shape[1]],
+                                           dtype=pred_dtype)
+                rel_probs_dense[relations[:, 0], relations[:, 1]] = rel_probs_flat
+                out_dict[mi]['relations'] = rel_probs_dense
+    return out_dicts
 
 def non_gt_rois(roidb):
     overlaps = roidb['max_overlaps']
@@ -178,8 +322,63 @@ def gt_rois(roidb):
     rois = roidb['boxes'][gt_inds]
     return rois
 
-def test_net(net_name, weight_name, imdb, mode, max_per_image=100):
-    sess = tf.Session()
+def _get_test_graph(roidb_entry, mode):
+    """
+    Return the boxes and relations (None: all pairs) of the graph to detect
+    in a test image, or (None, None) if the image has fewer than two boxes.
+    If the relation candidates are all pruned (see rel_pair_candidates),
+    the relations are empty: the image has no predictions but is still
+    evaluated.
+    """
+    relations = None
+    if mode == 'pred_cls' or mode == 'sg_cls':
+        # use ground truth object locations
+        box_proposals = gt_rois(roidb_entry)
+    else:
+        # use RPN-proposed object locations
+        box_proposals, roi_scores = non_gt_rois(roidb_entry)
+        roi_scores = np.expand_dims(roi_scores, axis=1)
+        nms_keep = cpu_nms(np.hstack((box_proposals, roi_scores)).astype(np.float32),
+                    cfg.TEST.PROPOSAL_NMS)
+        nms_keep = np.array(nms_keep)
+        num_proposal = min(cfg.TEST.NUM_PROPOSALS, nms_keep.shape[0])
+        keep = nms_keep[:num_proposal]
+        box_proposals = box_proposals[keep, :]
+        proposal_scores = roi_scores[keep, 0]
+        if box_proposals.shape[0] >= 2:
+            relations = rel_pair_candidates(box_proposals, proposal_scores)
+
+    if box_proposals.size == 0 or box_proposals.shape[0] < 2:
+        return None, None
+    return box_proposals, relations
+
+def _no_triplets():
+    # the (empty) triplets, triplet boxes and scores of relation_triplets
+    return (np.zeros((0, 3), dtype=np.int32), np.zeros((0, 8), dtype=np.int32),
+            np.zeros(0, dtype=np.float32))
+
+def _load_test_ckpt(ckpt_file, im_inds):
+    """
+    Return the state saved by _run_test in a checkpoint file, None if there
+    is no checkpoint
+    """
+    if ckpt_file is None or not os.path.exists(ckpt_file):
+        return None
+    state = np.load(ckpt_file, allow_pickle=True).item()
+    assert np.array_equal(state['im_inds'], im_inds), \
+        'checkpoint %s is for different images' % ckpt_file
+    return state
+
+def _save_test_ckpt(ckpt_file, state):
+    # write a new file and rename it, so that a run that is killed while
+    # saving keeps its previous checkpoint
+    tmp_file = ckpt_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.save(f, state)
+    os.rename(tmp_file, ckpt_file)
+
+def _setup_test_net(net_name, weight_name, imdb, sess_config=None):
+    sess = tf.Session(config=sess_config)
 
     # set up testing mode
     rois = tf.placeholder(dtype=tf.float32, shape=[None, 5], name='rois')
@@ -206,13 +405,21 @@ def test_net(net_name, weight_name, imdb, mode, max_per_image=100):
     print ('Loading model weights from {:s}').format(weight_name)
     saver = tf.train.Saver()
     saver.restore(sess, weight_name)
+    return sess, net, inputs
+
+def _run_test(sess, net, inputs, imdb, mode, im_inds, dump_file=None,
+              ckpt_file=None):
+    """
+    Detect and evaluate the scene graphs of the images im_inds, return the
+    evaluators ({mode: {inference iteration: SceneGraphEvaluator}})
 
+    ckpt_file: if given, the evaluation state (and the size of the
+    prediction dump) is saved to this file every cfg.TEST.CKPT_FREQ images,
+    and a run resumes from the images that the checkpoint has not covered
+    """
     roidb = imdb.roidb
-    if cfg.TEST.USE_RPN_DB:
-        imdb.add_rpn_rois(roidb, make_copy=False)
-    prepare_roidb(roidb)
 
-    num_images = len(imdb.image_index)
+    num_images = len(im_inds)
 
     # timers
     _t = {'im_detect' : Timer(), 'evaluate' : Timer()}
@@ -221,7 +428,10 @@ def test_net(net_name, weight_name, imdb, mode, max_per_image=100):
         eval_modes = ['pred_cls', 'sg_cls', 'sg_det']
     else:
         eval_modes = [mode]
-    multi_iter = [net.n_iter - 1] if net.iterable else [0]
+    if net.iterable and cfg.TEST.EVAL_ALL_ITERS:
+        multi_iter = range(net.n_iter)
+    else:
+        multi_iter = [net.n_iter - 1] if net.iterable else [0]
     print('Graph Inference Iteration ='),
     print(multi_iter)
     print('EVAL MODES ='),
@@ -234,47 +444,211 @@ def test_net(net_name, weight_name, imdb, mode, max_per_image=100):
         for it in multi_iter:
             evaluators[m][it] = SceneGraphEvaluator(imdb, mode=m)
 
-    for im_i in xrange(num_images):
-
-        im = imdb.im_getter(im_i)
-
-        for mode in eval_modes:
-            bbox_reg = True
-            if mode == 'pred_cls' or mode == 'sg_cls':
-                # use ground truth object locations
-                bbox_reg = False
-                box_proposals = gt_rois(roidb[im_i])
+    # modes that detect the same boxes share one run of the network
+    mode_groups = []
+    gt_modes = [m for m in eval_modes if m in ['pred_cls', 'sg_cls']]
+    if len(gt_modes) > 0:
+        mode_groups.append(gt_modes)
+    if 'sg_det' in eval_modes:
+        mode_groups.append(['sg_det'])
+
+    # resume from a checkpoint
+    num_done = 0
+    dump_sizes = None
+    ckpt_state = _load_test_ckpt(ckpt_file, im_inds)
+    if ckpt_state is not None:
+        num_done = ckpt_state['num_done']
+        dump_sizes = ckpt_state['dump_sizes']
+        for m in eval_modes:
+            for it in multi_iter:
+                evaluators[m][it].load_state_dict(ckpt_state['evaluators'][m][it])
+        print('Resuming from %s after %i images' % (ckpt_file, num_done))
+
+    pred_dump = None
+    if dump_file is not None:
+        if ckpt_state is not None:
+            assert dump_sizes is not None, \
+                'checkpoint %s was saved without a prediction dump' % ckpt_file
+        pred_dump = PredictionWriter(dump_file, cfg.TEST.DUMP_TOP_K, dump_sizes,
+                                     score_dtype=cfg.TEST.DUMP_SCORE_DTYPE)
+        print('Writing predictions to %s' % dump_file)
+
+    def save_ckpt():
+        evaluator_states = {}
+        for m in eval_modes:
+            evaluator_states[m] = {}
+            for it in multi_iter:
+                evaluator_states[m][it] = evaluators[m][it].state_dict()
+        _save_test_ckpt(ckpt_file, {
+            'im_inds': np.array(im_inds),
+            'num_done': num_done,
+            'evaluators': evaluator_states,
+            'dump_sizes': pred_dump.checkpoint() if pred_dump is not None else None})
+
+    batch_size = cfg.TEST.IMS_PER_BATCH
+    last_ckpt = num_done
+    imdb.prefetch_images(im_inds[num_done:num_done + batch_size])
+    for batch_start in xrange(num_done, num_images, batch_size):
+        batch_inds = im_inds[batch_start:batch_start + batch_size]
+        batch_ims = [imdb.im_getter(im_i) for im_i in batch_inds]
+        # decode the next images while the network runs
+        imdb.prefetch_images(im_inds[batch_start + batch_size:
+                                     batch_start + 2 * batch_size])
+        roidb_entries = [prepare_test_roidb_entry(imdb, roidb[im_i]) for im_i in batch_inds]
+
+        # the conv features of the batch are computed once for all modes
+        blob_cache = {}
+        for proposal_modes in mode_groups:
+            # use ground truth object locations for pred_cls and sg_cls
+            bbox_reg = proposal_modes[0] == 'sg_det'
+            boxes_list = []
+            relations_list = []
+            pruned = []
+            for roidb_entry in roidb_entries:
+                box_proposals, relations = _get_test_graph(roidb_entry, proposal_modes[0])
+                # all relation candidates pruned: no predictions, but the
+                # image still counts in R@K
+                pruned.append(relations is not None and relations.shape[0] == 0)
+                if box_proposals is None or pruned[-1]:
+                    # no graph, run the image without boxes
+                    box_proposals = np.zeros((0, 4))
+                    relations = np.zeros((0, 2), dtype=np.int32)
+                boxes_list.append(box_proposals)
+                relations_list.append(relations)
+            if all([boxes.shape[0] == 0 for boxes in boxes_list]):
+                out_dicts = [None for _ in batch_inds]
             else:
-                # use RPN-proposed object locations
-                box_proposals, roi_scores = non_gt_rois(roidb[im_i])
-                roi_scores = np.expand_dims(roi_scores, axis=1)
-                nms_keep = cpu_nms(np.hstack((box_proposals, roi_scores)).astype(np.float32),
-                            cfg.TEST.PROPOSAL_NMS)
-                nms_keep = np.array(nms_keep)
-                num_proposal = min(cfg.TEST.NUM_PROPOSALS, nms_keep.shape[0])
-                keep = nms_keep[:num_proposal]
-                box_proposals = box_proposals[keep, :]
-
-
-            if box_proposals.size == 0 or box_proposals.shape[0] < 2:
-                # continue if no graph
-                continue
-
-            _t['im_detect'].tic()
-            out_dict = im_detect(sess, net, inputs, im, box_proposals,
-                                 bbox_reg, multi_iter)
-            _t['im_detect'].toc()
+                _t['im_detect'].tic()
+                out_dicts = im_detect_batch(sess, net, inputs, batch_ims, boxes_list,
+                                            bbox_reg, multi_iter, relations_list,
+                                            blob_cache)
+                _t['im_detect'].toc()
             _t['evaluate'].tic()
-            for iter_n in multi_iter:
-                sg_entry = out_dict[iter_n]
-                evaluators[mode][iter_n].evaluate_scene_graph_entry(sg_entry, im_i, iou_thresh=0.5)
+            for im_i, roidb_entry, boxes, is_pruned, out_dict in \
+                    zip(batch_inds, roidb_entries, boxes_list, pruned, out_dicts):
+                if boxes.shape[0] == 0 and not is_pruned:
+                    continue
+                for mode in proposal_modes:
+                    for iter_n in multi_iter:
+                        if is_pruned:
+                            triplets, triplet_boxes, triplet_scores = _no_triplets()
+                        else:
+                            triplets, triplet_boxes, triplet_scores = \
+                                relation_triplets(out_dict[iter_n], roidb_entry, mode)
+                        if pred_dump is not None:
+                            pred_dump.write(mode, iter_n, im_i, triplets,
+                                            triplet_boxes, triplet_scores)
+                        evaluators[mode][iter_n].evaluate_triplets(triplets, triplet_boxes, im_i, iou_thresh=0.5,
+                                                                   roidb_entry=roidb_entry)
             _t['evaluate'].toc()
 
+        num_done = batch_start + len(batch_inds)
         print 'im_detect: {:d}/{:d} {:.3f}s {:.3f}s' \
-              .format(im_i + 1, num_images, _t['im_detect'].average_time,
+              .format(num_done, num_images, _t['im_detect'].average_time,
                       _t['evaluate'].average_time)
 
+        if ckpt_file is not None and num_done - last_ckpt >= cfg.TEST.CKPT_FREQ:
+            save_ckpt()
+            last_ckpt = num_done
+
+    if ckpt_file is not None:
+        save_ckpt()
+    if pred_dump is not None:
+        pred_dump.close()
+
+    return evaluators
+
+def _print_stats(evaluators):
     # print out evaluation results
-    for mode in eval_modes:
-        for iter_n in multi_iter:
+    multi_iter = set()
+    for mode in evaluators:
+        multi_iter.update(evaluators[mode].keys())
+    for mode in ['pred_cls', 'sg_cls', 'sg_det']:
+        if mode not in evaluators:
+            continue
+        for iter_n in sorted(evaluators[mode]):
+            if len(multi_iter) > 1:
+                print('inference iteration %i:' % iter_n)
             evaluators[mode][iter_n].print_stats()
+
+def test_net(net_name, weight_name, imdb, mode, max_per_image=100, dump_file=None,
+             ckpt_file=None):
+    """
+    dump_file: if given, the top cfg.TEST.DUMP_TOP_K triplets predicted for
+    each image are also written to this file (see datasets.pred_dump)
+    ckpt_file: if given, save the evaluation state to this file from time to
+    time, and resume from it if it exists (see _run_test)
+    """
+    sess, net, inputs = _setup_test_net(net_name, weight_name, imdb)
+    im_inds = range(len(imdb.image_index))
+    evaluators = _run_test(sess, net, inputs, imdb, mode, im_inds,
+                           dump_file, ckpt_file)
+    _print_stats(evaluators)
+    return evaluators
+
+def _shard_file(filename, shard):
+    root, ext = os.path.splitext(filename)
+    return '%s_shard%i%s' % (root, shard, ext)
+
+def _test_shard(net_name, weight_name, imdb, mode, im_inds, num_threads,
+                dump_file, ckpt_file):
+    # the main function of a test_net_sharded process
+    config = tf.ConfigProto()
+    config.allow_soft_placement = True
+    config.gpu_options.allow_growth = True # the shards share the gpu
+    config.intra_op_parallelism_threads = num_threads
+    config.inter_op_parallelism_threads = num_threads
+    sess, net, inputs = _setup_test_net(net_name, weight_name, imdb, config)
+    _run_test(sess, net, inputs, imdb, mode, im_inds, dump_file, ckpt_file)
+
+def test_net_sharded(net_name, weight_name, imdb, mode, num_shards, ckpt_dir,
+                     dump_file=None):
+    """
+    Test on num_shards processes, each with its own TensorFlow session, that
+    test consecutive parts of the test set. Every shard saves its results
+    to a checkpoint in ckpt_dir (see _run_test), so that an interrupted run
+    continues where it stopped when it is started again. The results of the
+    shards are merged when all of them are done.
+
+    dump_file: if given, each shard writes its predictions to
+    <dump_file>_shard<i> (see tools/eval_dump.py)
+    """
+    if not os.path.exists(ckpt_dir):
+        os.makedirs(ckpt_dir)
+    num_threads = cfg.TEST.SHARD_THREADS
+    if num_threads <= 0:
+        num_threads = max(multiprocessing.cpu_count() // num_shards, 1)
+
+    # the roidb arrays are shared with (not copied to) the shard processes
+    imdb.share_memory()
+    shards = np.array_split(np.arange(len(imdb.image_index)), num_shards)
+    ckpt_files = [os.path.join(ckpt_dir, 'shard%i_of_%i.npy' % (i, num_shards))
+                  for i in xrange(num_shards)]
+    processes = []
+    for i, shard_inds in enumerate(shards):
+        shard_dump = _shard_file(dump_file, i) if dump_file is not None else None
+        p = multiprocessing.Process(target=_test_shard,
+                                    args=(net_name, weight_name, imdb, mode,
+                                          shard_inds.tolist(), num_threads,
+                                          shard_dump, ckpt_files[i]))
+        p.start()
+        processes.append(p)
+    for p in processes:
+        p.join()
+    failed = [i for i, p in enumerate(processes) if p.exitcode != 0]
+    if len(failed) > 0:
+        raise RuntimeError('test shards %s failed, run again to resume' % failed)
+
+    # merge the results of the shards
+    evaluators = {}
+    for i, ckpt_file in enumerate(ckpt_files):
+        state = _load_test_ckpt(ckpt_file, shards[i].tolist())
+        assert state['num_done'] == len(shards[i])
+        for m, iter_states in state['evaluators'].items():
+            for it, evaluator_state in iter_states.items():
+                if it not in evaluators.setdefault(m, {}):
+                    evaluators[m][it] = SceneGraphEvaluator(imdb, mode=m)
+                evaluators[m][it].merge(evaluator_state)
+    _print_stats(evaluators)
+    return evaluators
+
@@ -10,6 +10,7 @@ Train a scene graph generation network
 
 import tensorflow as tf
 import numpy as np
+import multiprocessing
 import os
 
 from fast_rcnn.config import cfg
@@ -69,12 +70,40 @@ class Trainer(object):
         self.saver.save(sess, filename)
         print 'Wrote snapshot to: {:s}'.format(filename)
 
+        # save the position of the data sampler to resume training from here
+        if self.data_runner.last_task is not None:
+            state = {'iter': iter, 'sampler': self.data_runner.last_task[1]}
+            np.save(filename[:-len('.ckpt')] + '_state.npy', state)
+
         if cfg.TRAIN.BBOX_REG and 'bbox_pred' in net.layers and cfg.TRAIN.BBOX_NORMALIZE_TARGETS:
             # restore net to original state
             sess.run(weights.assign(orig_0))
             sess.run(biases.assign(orig_1))
 
 
+    def _normalize_bbox_pred(self, sess):
+        # undo the unnormalization of the bbox regression weights done by
+        # snapshot, to resume training from a snapshot
+        with tf.variable_scope('bbox_pred', reuse=True):
+            weights = tf.get_variable("weights")
+            biases = tf.get_variable("biases")
+        weights_shape = weights.get_shape().as_list()
+        sess.run(weights.assign(weights.eval() / np.tile(self.bbox_stds.ravel(), (weights_shape[0],1))))
+        sess.run(biases.assign((biases.eval() - self.bbox_means.ravel()) / self.bbox_stds.ravel()))
+
+
+    def _restore(self, sess, ckpt_file, variables):
+        # restore the variables that are in the checkpoint: weights saved
+        # for testing, or before the optimizer slots were saved, leave the
+        # momentum at zero
+        ckpt_vars = tf.train.NewCheckpointReader(ckpt_file).get_variable_to_shape_map()
+        restored = [v for v in variables if v.op.name in ckpt_vars]
+        if len(restored) < len(variables):
+            print('%i of %i variables are not in %s and keep their initial value' %
+                  (len(variables) - len(restored), len(variables), ckpt_file))
+        tf.train.Saver(restored).restore(sess, ckpt_file)
+
+
     def get_data_runner(self, sess, data_layer):
 
         input_pls = {
@@ -94,16 +123,30 @@ class Trainer(object):
             'rel_pair_segment_inds': tf.placeholder(dtype=tf.int32, shape=[None])
         }
 
+        if cfg.TRAIN.USE_CONV_CACHE:
+            # feed cached conv5_3 feature maps instead of images
+            del input_pls['ims']
+            input_pls['conv_out'] = tf.placeholder(dtype=tf.float32, shape=[None, None, None, 512])
+
+        if cfg.GRAPH_DATA_IN_TF:
+            # computed by the network from rois and relations
+            for k in ['rel_rois', 'num_roi', 'num_rel', 'rel_mask_inds',
+                      'rel_segment_inds', 'rel_pair_mask_inds',
+                      'rel_pair_segment_inds']:
+                del input_pls[k]
+
         def data_generator():
             while True:
                 yield data_layer.next_batch()
 
         def task_generator():
             while True:
-                yield data_layer._get_next_minibatch_inds()
+                yield data_layer.next_task()
 
-        task_func = data_layer._get_next_minibatch
-        data_runner = DataRunnerMP(task_func, task_generator, input_pls, capacity=24)
+        task_func = data_layer.run_task
+        data_runner = DataRunnerMP(task_func, task_generator, input_pls, capacity=24,
+                                   shm_slots=cfg.TRAIN.SHM_BATCH_SLOTS,
+                                   shm_slot_size=cfg.TRAIN.SHM_SLOT_MB * 2**20)
 
         return data_runner
 
@@ -114,8 +157,28 @@ class Trainer(object):
 
         # a multi-process data runner
         data_runner = self.get_data_runner(sess, data_layer)
+        self.data_runner = data_runner
+
+        # resume the data sampler and the iteration count of a snapshot
+        start_iter = 0
+        resume = False
+        if self.pretrained_model is not None and self.pretrained_model.endswith('.ckpt'):
+            state_fn = self.pretrained_model[:-len('.ckpt')] + '_state.npy'
+            if os.path.exists(state_fn):
+                state = np.load(state_fn, allow_pickle=True).item()
+                data_layer.set_state(state['sampler'])
+                start_iter = state['iter'] + 1
+                resume = True
+                print('Resuming training from iteration %i' % start_iter)
+        if start_iter >= max_iters:
+            print('Snapshot %s is already at iteration %i of %i' %
+                  (self.pretrained_model, start_iter, max_iters))
+            return
 
         inputs= data_runner.get_inputs()
+        if cfg.TRAIN.USE_CONV_CACHE:
+            # never fed, the network reads the cached 'conv_out' instead
+            inputs['ims'] = tf.placeholder(dtype=tf.float32, shape=[None, None, None, 3])
 
         inputs['num_classes'] = self.imdb.num_classes
         inputs['num_predicates'] = self.imdb.num_predicates
@@ -135,20 +198,32 @@ class Trainer(object):
         lr = tf.Variable(cfg.TRAIN.LEARNING_RATE, trainable=False)
         momentum = cfg.TRAIN.MOMENTUM
 
-        ops['train'] = tf.train.MomentumOptimizer(lr, momentum).minimize(ops['loss_total'])
+        optimizer = tf.train.MomentumOptimizer(lr, momentum)
+        ops['train'] = optimizer.minimize(ops['loss_total'])
 
         ops_summary = dict(ops)
         #merge summaries
         ops_summary['summary'] = tf.merge_all_summaries()
         train_writer = tf.train.SummaryWriter(self.tf_log, sess.graph)
 
-        self.saver = tf.train.Saver(tf.trainable_variables(), max_to_keep=None)
+        # snapshots also hold the momentum of the optimizer, so that a
+        # resumed run continues with the same updates
+        save_vars = tf.trainable_variables()
+        for slot in optimizer.get_slot_names():
+            slot_vars = [optimizer.get_slot(v, slot) for v in tf.trainable_variables()]
+            save_vars += [v for v in slot_vars if v is not None]
+        self.saver = tf.train.Saver(save_vars, max_to_keep=None)
 
         sess.run(tf.initialize_all_variables())
 
 
+        # share the roidb with the data workers instead of copying it
+        self.imdb.share_memory()
+        n_processes = cfg.TRAIN.NUM_DATA_WORKERS
+        if n_processes <= 0:
+            n_processes = multiprocessing.cpu_count()
         #data_runner.start_threads(sess, n_threads=10)
-        data_runner.start_processes(sess, n_processes=3)
+        data_runner.start_processes(sess, n_processes=n_processes)
         # intialize variables
 
         if self.pretrained_model is not None:
@@ -157,7 +232,10 @@ class Trainer(object):
             if self.pretrained_model.endswith('.npy'):
                 self.net.load(self.pretrained_model, sess, load_fc=True)
             elif self.pretrained_model.endswith('.ckpt'):
-                self.saver.restore(sess, self.pretrained_model)
+                self._restore(sess, self.pretrained_model, save_vars)
+                if resume and cfg.TRAIN.BBOX_REG and 'bbox_pred' in self.net.layers \
+                        and cfg.TRAIN.BBOX_NORMALIZE_TARGETS:
+                    self._normalize_bbox_pred(sess)
             else:
                 print('Unsupported pretrained weights format')
                 raise
@@ -168,7 +246,10 @@ class Trainer(object):
 
         # Training loop
 
-        for iter in range(max_iters):
+        if start_iter >= cfg.TRAIN.STEPSIZE:
+            sess.run(tf.assign(lr, cfg.TRAIN.LEARNING_RATE * cfg.TRAIN.GAMMA))
+
+        for iter in range(start_iter, max_iters):
             # learning rate
             iter_timer.tic()
             if (iter+1) % cfg.TRAIN.STEPSIZE == 0:
@@ -9,8 +9,7 @@ Visualize a generated scene graph
 """
 
 from fast_rcnn.config import cfg
-from roi_data_layer.roidb import prepare_roidb
-from fast_rcnn.test import im_detect, gt_rois, non_gt_rois
+from fast_rcnn.test import im_detect, gt_rois, non_gt_rois, prepare_test_roidb_entry
 from datasets.viz import viz_scene_graph, draw_scene_graph
 from datasets.eval_utils import ground_predictions
 from networks.factory import get_network
@@ -114,9 +113,6 @@ def viz_net(net_name, weight_name, imdb, viz_mode='viz_cls'):
     saver.restore(sess, weight_name)
 
     roidb = imdb.roidb
-    if cfg.TEST.USE_RPN_DB:
-        imdb.add_rpn_rois(roidb, make_copy=False)
-    prepare_roidb(roidb)
 
     num_images = len(imdb.image_index)
 
@@ -131,15 +127,16 @@ def viz_net(net_name, weight_name, imdb, viz_mode='viz_cls'):
 
     for im_i in xrange(num_images):
         im = imdb.im_getter(im_i)
+        roidb_entry = prepare_test_roidb_entry(imdb, roidb[im_i])
 
         bbox_reg = True
         if viz_mode == 'viz_cls':
             # use ground truth bounding boxes
             bbox_reg = False
-            box_proposals = gt_rois(roidb[im_i])
+            box_proposals = gt_rois(roidb_entry)
         elif viz_mode == 'viz_det':
             # use RPN-proposed object locations
-            box_proposals, roi_scores = non_gt_rois(roidb[im_i])
+            box_proposals, roi_scores = non_gt_rois(roidb_entry)
             roi_scores = np.expand_dims(roi_scores, axis=1)
             nms_keep = cpu_nms(np.hstack((box_proposals, roi_scores)).astype(np.float32),
                         cfg.TEST.PROPOSAL_NMS)
@@ -154,10 +151,10 @@ def viz_net(net_name, weight_name, imdb, viz_mode='viz_cls'):
             continue
 
         out_dict = im_detect(sess, net, inputs, im, box_proposals,
-                                bbox_reg, [inference_iter])
+                                bbox_reg, [inference_iter], dense_relations=True)
         sg_entry = out_dict[inference_iter]
 
         # ground predicted graphs to ground truth annotations
-        gt_to_pred = ground_predictions(sg_entry, roidb[im_i], 0.5)
+        gt_to_pred = ground_predictions(sg_entry, roidb_entry, 0.5)
         draw_graph_pred(im, sg_entry['boxes'], sg_entry['scores'], sg_entry['relations'],
-                             gt_to_pred, roidb[im_i])
+                             gt_to_pred, roidb_entry)
@@ -14,6 +14,7 @@ __sets['vrd'] = vrd # VRD baseline
 __sets['dual_graph_vrd_avgpool'] = dual_graph_vrd_avgpool  # avg pooling baseline
 __sets['dual_graph_vrd_maxpool'] = dual_graph_vrd_maxpool  # max pooling baseline
 __sets['dual_graph_vrd_final'] = dual_graph_vrd_final  # final model
+__sets['dual_graph_vrd_final_svd'] = dual_graph_vrd_final_svd  # final model, truncated SVD fc layers
 
 def get_network(name):
     """Get a network by name."""
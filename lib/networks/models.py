@@ -22,10 +22,22 @@ class basenet(Network):
         self.data = data
         self.ims = data['ims']
         self.rois = data['rois']
+        # precomputed conv features fed in place of the trunk output
+        self.conv_feats = data.get('conv_out')
+        self.relations = data.get('relations')
         self.iterable = False
         self.keep_prob = tf.placeholder(tf.float32)
         self.layers = {}
 
+    def _rel_rois(self):
+        """
+        union boxes of the relations, computed from rois and relations if
+        cfg.GRAPH_DATA_IN_TF is set, fed otherwise
+        """
+        if cfg.GRAPH_DATA_IN_TF:
+            return utils.union_boxes(self.rois, self.relations)
+        return self.data['rel_rois']
+
     def _vgg16(self):
         self.layers = dict({'ims': self.ims, 'rois': self.rois})
         self._vgg_conv()
@@ -52,21 +64,50 @@ class basenet(Network):
              .conv(3, 3, 512, 1, 1, name='conv5_3')
              .stop_gradient(name='conv_out'))
 
+        if self.conv_feats is not None:
+            # the trunk is still built so that its weights are loaded and
+            # saved with snapshots, but it is never run
+            self.layers['conv_out'] = self.conv_feats
+
     def _vgg_fc(self):
         (self.feed('conv_out', 'rois')
              .roi_pool(7, 7, 1.0/16, name='pool5')
-             .fc(4096, name='fc6')
+             .head_fc(4096, name='fc6')
              .dropout(self.keep_prob, name='drop6')
-             .fc(4096, name='fc7')
+             .head_fc(4096, name='fc7')
              .dropout(self.keep_prob, name='vgg_out'))
 
     def _union_rel_vgg_fc(self):
-        (self.feed('conv_out', 'rel_rois')
+        if not cfg.SHARE_UNION_FEATS:
+            self._rel_vgg_head('rel_rois', 'rel_vgg_out')
+            return
+
+        # (i, j) and (j, i) have the same union box: pool and run the fc
+        # layers once per unordered pair and gather the features back
+        num_roi = tf.shape(self.rois)[0]
+        sub = self.relations[:, 0]
+        obj = self.relations[:, 1]
+        pair_keys = tf.minimum(sub, obj) * num_roi + tf.maximum(sub, obj)
+        pair_keys, pair_inds = tf.unique(pair_keys)
+        pairs = tf.pack([tf.div(pair_keys, num_roi), tf.mod(pair_keys, num_roi)], axis=1)
+        self.wrap(utils.union_boxes(self.rois, pairs), 'rel_rois_unique')
+        self._rel_vgg_head('rel_rois_unique', 'rel_vgg_out_unique')
+        self.wrap(tf.gather(self.get_output('rel_vgg_out_unique'), pair_inds),
+                  'rel_vgg_out')
+
+    def _rel_vgg_head(self, rois_layer, out_name):
+        (self.feed('conv_out', rois_layer)
              .roi_pool(7, 7, 1.0/16, name='rel_pool5')
-             .fc(4096, name='rel_fc6')
+             .head_fc(4096, name='rel_fc6')
              .dropout(self.keep_prob, name='rel_drop6')
-             .fc(4096, name='rel_fc7')
-             .dropout(self.keep_prob, name='rel_vgg_out'))
+             .head_fc(4096, name='rel_fc7')
+             .dropout(self.keep_prob, name=out_name))
+
+    def head_fc(self, num_out, name):
+        """
+        fc layer of the VGG heads (fc6, fc7, rel_fc6 and rel_fc7)
+        """
+        return self.fc(num_out, name=name)
 
     # predictions
     def _cls_pred(self, input_layer, layer_suffix='', reuse=False, new_var=False):
@@ -131,7 +172,10 @@ class basenet(Network):
         if iters is not None:
             op = {}
             for i in iters:
-                op[i] = self.get_output('bbox_pred')
+                if self.iterable and i != self.n_iter - 1:
+                    op[i] = self.get_output('bbox_pred_iter%i' % i)
+                else:
+                    op[i] = self.get_output('bbox_pred')
 
         else:
             op = self.get_output('bbox_pred')
@@ -155,20 +199,26 @@ class dual_graph_vrd(basenet):
     def __init__(self, data):
         basenet.__init__(self, data)
 
-        self.num_roi = data['num_roi']
-        self.num_rel = data['num_rel']
-        self.rel_rois = data['rel_rois']
+        if cfg.GRAPH_DATA_IN_TF:
+            # derive the graph structure from rois and relations
+            self.num_roi = tf.shape(self.rois)[0]
+            self.num_rel = tf.shape(self.relations)[0]
+            graph_inds = utils.graph_inds(self.relations, self.num_roi, self.num_rel)
+        else:
+            self.num_roi = data['num_roi']
+            self.num_rel = data['num_rel']
+            graph_inds = data
+        self.rel_rois = self._rel_rois()
         self.iterable = True
 
-        self.edge_mask_inds = data['rel_mask_inds']
-        self.edge_segment_inds = data['rel_segment_inds']
+        self.edge_mask_inds = graph_inds['rel_mask_inds']
+        self.edge_segment_inds = graph_inds['rel_segment_inds']
 
-        self.edge_pair_mask_inds = data['rel_pair_mask_inds']
-        self.edge_pair_segment_inds = data['rel_pair_segment_inds']
+        self.edge_pair_mask_inds = graph_inds['rel_pair_mask_inds']
+        self.edge_pair_segment_inds = graph_inds['rel_pair_segment_inds']
 
         # number of refine iterations
         self.n_iter = data['n_iter']
-        self.relations = data['relations']
 
         self.vert_state_dim = 512
         self.edge_state_dim = 512
@@ -317,6 +367,9 @@ class dual_graph_vrd(basenet):
         iter_suffix = '_iter%i' % iter_i if iter_i < self.n_iter - 1 else ''
         self._cls_pred(vert_factor, layer_suffix=iter_suffix, reuse=reuse)
         self._bbox_pred(vert_factor, layer_suffix=iter_suffix, reuse=reuse)
+        if iter_suffix:
+            # the layer name is shared by all iterations
+            self.layers['bbox_pred'+iter_suffix] = self.get_output('bbox_pred')
         self._rel_pred(edge_factor, layer_suffix=iter_suffix, reuse=reuse)
 
     def losses(self):
@@ -331,7 +384,7 @@ class vrd(basenet):
 
     def __init__(self, data):
         basenet.__init__(self, data)
-        self.rel_rois = data['rel_rois']
+        self.rel_rois = self._rel_rois()
 
     def setup(self):
         self.layers = dict({'ims': self.ims, 'rois': self.rois, 'rel_rois': self.rel_rois})
@@ -377,3 +430,22 @@ class dual_graph_vrd_final(dual_graph_vrd):
 
     def _compute_vert_context(self, edge_factor, vert_factor, reuse):
         return self._compute_vert_context_soft(edge_factor, vert_factor, reuse)
+
+
+class dual_graph_vrd_final_svd(dual_graph_vrd_final):
+    """
+    The final model with truncated SVD fc layers in the VGG heads, for
+    faster inference. Its weights are made from those of
+    dual_graph_vrd_final by tools/compress_fc.py, at the ranks of
+    cfg.TEST.SVD_FC6_RANK and cfg.TEST.SVD_FC7_RANK. A layer with an unset
+    rank (0, the default) is a plain fc layer, so with the default config
+    this is dual_graph_vrd_final and runs on its checkpoints.
+    """
+    def head_fc(self, num_out, name):
+        if name.endswith('fc6'):
+            rank = cfg.TEST.SVD_FC6_RANK
+        else:
+            rank = cfg.TEST.SVD_FC7_RANK
+        if rank <= 0:
+            return self.fc(num_out, name=name)
+        return self.fc_svd(num_out, rank, name=name)
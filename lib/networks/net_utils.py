@@ -61,3 +61,76 @@ def padded_segment_reduce(vecs, segment_inds, num_segments, reduction_mode):
         vecs_reduced = tf.segment_mean(vecs, segment_inds)
     vecs_reduced.set_shape([num_segments, vecs.get_shape()[1]])
     return vecs_reduced
+
+def union_boxes(rois, relations):
+    """
+    union boxes (batch_ind, x1, y1, x2, y2) of the subject and object rois
+    of each relation, see data_utils.compute_rel_rois
+    """
+    sub_rois = tf.gather(rois, relations[:, 0])
+    obj_rois = tf.gather(rois, relations[:, 1])
+    return tf.concat(1, [sub_rois[:, :1],
+                         tf.minimum(sub_rois[:, 1:3], obj_rois[:, 1:3]),
+                         tf.maximum(sub_rois[:, 3:], obj_rois[:, 3:])])
+
+def argsort(keys):
+    """
+    indices that sort a 1-D integer tensor in ascending order
+    """
+    return tf.nn.top_k(-keys, k=tf.size(keys)).indices
+
+def graph_inds(relations, num_roi, num_rel):
+    """
+    the graph structure of data_utils.create_graph_data, computed from the
+    relations in the graph
+    Output:
+        a dict of rel_mask_inds, rel_segment_inds, rel_pair_mask_inds and
+        rel_pair_segment_inds
+    """
+    sub = relations[:, 0]
+    obj = relations[:, 1]
+    rel_inds = tf.range(num_rel)
+    roi_inds = tf.range(num_roi)
+
+    # (roi, relation) incidences plus a dummy relation per roi, sorted by
+    # roi and then relation. self-loops are counted once.
+    keys = tf.concat(0, [sub * (num_rel + 1) + rel_inds,
+                         obj * (num_rel + 1) + rel_inds,
+                         roi_inds * (num_rel + 1) + num_rel])
+    keys, _ = tf.unique(keys)
+    keys = tf.gather(keys, argsort(keys))
+    rel_mask_inds = tf.mod(keys, num_rel + 1)
+    rel_segment_inds = tf.div(keys, num_rel + 1)
+
+    # relation index of each (sub, obj), the last one for duplicate relations
+    pair_keys = sub * num_roi + obj
+    order = argsort(pair_keys)
+    pair_keys, pair_segments = tf.unique(tf.gather(pair_keys, order))
+    pair_rel_inds = tf.segment_max(order, pair_segments)
+    # flat (num_roi x num_roi) relation index table, -1 if no relation
+    rel_table = tf.unsorted_segment_sum(pair_rel_inds + 1, pair_keys,
+                                        num_roi * num_roi) - 1
+
+    # rois that are connected in both directions, in row-major order
+    pair_sub = tf.div(pair_keys, num_roi)
+    pair_obj = tf.mod(pair_keys, num_roi)
+    rev_rel_inds = tf.gather(rel_table, pair_obj * num_roi + pair_sub)
+    bidir = tf.reshape(tf.where(rev_rel_inds >= 0), [-1])
+    pair_sub = tf.gather(pair_sub, bidir)
+    pair_obj = tf.gather(pair_obj, bidir)
+    out_inds = tf.gather(pair_rel_inds, bidir)
+    in_inds = tf.gather(rev_rel_inds, bidir)
+
+    # append a dummy pair to the pairs of every roi
+    pad_inds = tf.fill(tf.expand_dims(num_roi, 0), num_rel)
+    order = argsort(tf.concat(0, [pair_sub * (num_roi + 1) + pair_obj,
+                                  roi_inds * (num_roi + 1) + num_roi]))
+    rel_pair_mask_inds = tf.pack([tf.concat(0, [out_inds, pad_inds]),
+                                  tf.concat(0, [in_inds, pad_inds])], axis=1)
+    rel_pair_mask_inds = tf.gather(rel_pair_mask_inds, order)
+    rel_pair_segment_inds = tf.gather(tf.concat(0, [pair_sub, roi_inds]), order)
+
+    return {'rel_mask_inds': rel_mask_inds,
+            'rel_segment_inds': rel_segment_inds,
+            'rel_pair_mask_inds': rel_pair_mask_inds,
+            'rel_pair_segment_inds': rel_pair_segment_inds}
@@ -2,6 +2,7 @@ import numpy as np
 import tensorflow as tf
 import roi_pooling_layer.roi_pooling_op as roi_pool_op
 import roi_pooling_layer.roi_pooling_op_grad
+from fast_rcnn.config import cfg
 
 DEFAULT_PADDING = 'SAME'
 
@@ -211,15 +212,7 @@ class Network(object):
             if isinstance(input, tuple):
                 input = input[0]
 
-            input_shape = input.get_shape()
-            print input_shape
-            if input_shape.ndims == 4:
-                dim = 1
-                for d in input_shape[1:].as_list():
-                    dim *= d
-                feed_in = tf.reshape(input, [-1, dim])
-            else:
-                feed_in, dim = (input, int(input_shape[-1]))
+            feed_in, dim = self._fc_input(input)
 
             init_weights = tf.truncated_normal_initializer(0.0, stddev=0.001)
             init_biases = tf.constant_initializer(0.0)
@@ -232,9 +225,44 @@ class Network(object):
 
             return fc
 
+    @layer
+    def fc_svd(self, input, num_out, rank, name, relu=True, trainable=True):
+        """
+        fc layer whose (dim, num_out) weight matrix is factorized into a
+        (dim, rank) and a (rank, num_out) matrix (see tools/compress_fc.py)
+        """
+        with tf.variable_scope(name) as scope:
+            if isinstance(input, tuple):
+                input = input[0]
+            feed_in, dim = self._fc_input(input)
+
+            init_weights = tf.truncated_normal_initializer(0.0, stddev=0.001)
+            init_biases = tf.constant_initializer(0.0)
+            weights_in = self.make_var('weights_in', [dim, rank], init_weights, trainable)
+            weights_out = self.make_var('weights_out', [rank, num_out], init_weights, trainable)
+            biases = self.make_var('biases', [num_out], init_biases, trainable)
+            fc = tf.matmul(tf.matmul(feed_in, weights_in), weights_out) + biases
+            if relu:
+                fc = tf.nn.relu(fc, name=scope.name)
+            else:
+                fc = tf.identity(fc, name=scope.name)
+
+            return fc
+
+    def _fc_input(self, input):
+        # flatten a 4-d input of a fc layer, return it and its dimension
+        input_shape = input.get_shape()
+        print input_shape
+        if input_shape.ndims == 4:
+            dim = 1
+            for d in input_shape[1:].as_list():
+                dim *= d
+            return tf.reshape(input, [-1, dim]), dim
+        return input, int(input_shape[-1])
+
     @layer
     def softmax(self, input, name):
-        input = tf.cast(input, dtype=tf.float64)
+        input = tf.cast(input, dtype=tf.as_dtype(cfg.SOFTMAX_DTYPE))
         return tf.nn.softmax(input, name=name)
 
     @layer
@@ -0,0 +1,144 @@
+# --------------------------------------------------------
+# Scene Graph Generation by Iterative Message Passing
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""
+A chunked, memory-mapped store of precomputed conv feature maps.
+
+The VGG trunk (conv1_1 - conv5_3) is frozen during training, so its output
+only depends on the input image, the training scale and whether the image
+is flipped. The store holds one feature map per (db_idx, scale_ind, flipped)
+key. Feature maps are appended to fixed-size chunk files and read back as
+read-only np.memmap views, so the data runner workers share the page cache
+instead of holding private copies.
+
+Layout of a cache directory:
+    index.npy       a dict with the key -> (chunk, offset, shape) index
+    chunk_%05i.bin  raw feature maps (H x W x C, C-order)
+"""
+
+import os
+import numpy as np
+
+INDEX_FILE = 'index.npy'
+CHUNK_FILE = 'chunk_%05i.bin'
+
+
+class ConvFeatureCache(object):
+
+    def __init__(self, cache_dir, mode='r', dtype=np.float32, chunk_size=2**30,
+                 scales=None, max_size=None):
+        """
+        cache_dir: directory of the store
+        mode: 'r' to read an existing store, 'w' to create a new one
+        dtype: storage dtype of the feature maps (write mode only)
+        chunk_size: approximate size of a chunk file in bytes (write mode only)
+        scales, max_size: image scales the features were computed at, checked
+            against the training config when the store is read
+        """
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self._chunks = {}
+
+        if mode == 'w':
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            self.dtype = np.dtype(dtype)
+            self.chunk_size = chunk_size
+            self.scales = tuple(scales) if scales is not None else None
+            self.max_size = max_size
+            self._keys = []
+            self._locs = []
+            self._shapes = []
+            self._im_scales = []
+            self._chunk_i = 0
+            self._chunk_fp = open(self._chunk_fn(0), 'wb')
+            self._chunk_offset = 0
+        elif mode == 'r':
+            index = np.load(os.path.join(cache_dir, INDEX_FILE),
+                            allow_pickle=True).item()
+            self.dtype = np.dtype(index['dtype'])
+            self.scales = index['scales']
+            self.max_size = index['max_size']
+            self._locs = index['locs']
+            self._shapes = index['shapes']
+            self._im_scales = index['im_scales']
+            self._lookup = {}
+            for i, key in enumerate(index['keys']):
+                self._lookup[tuple(key)] = i
+        else:
+            raise ValueError('Unknown cache mode: %s' % mode)
+
+    def _chunk_fn(self, chunk_i):
+        return os.path.join(self.cache_dir, CHUNK_FILE % chunk_i)
+
+    def __len__(self):
+        return len(self._lookup) if self.mode == 'r' else len(self._keys)
+
+    def check_config(self, scales, max_size):
+        """
+        make sure the features were extracted with the given image scales
+        """
+        if self.scales != tuple(scales) or self.max_size != max_size:
+            raise ValueError('conv feature cache %s was built with scales=%s, '
+                             'max_size=%s, but the config uses scales=%s, '
+                             'max_size=%s' % (self.cache_dir, self.scales,
+                                              self.max_size, tuple(scales),
+                                              max_size))
+
+    def add(self, db_idx, scale_ind, flipped, im_scale, feat):
+        """
+        append the feature map (H x W x C) of an image
+        """
+        assert(self.mode == 'w')
+        feat = np.ascontiguousarray(feat, dtype=self.dtype)
+        if self._chunk_offset > 0 and \
+                self._chunk_offset + feat.nbytes > self.chunk_size:
+            # start a new chunk
+            self._chunk_fp.close()
+            self._chunk_i += 1
+            self._chunk_fp = open(self._chunk_fn(self._chunk_i), 'wb')
+            self._chunk_offset = 0
+        self._chunk_fp.write(feat.tobytes())
+        self._keys.append([db_idx, scale_ind, int(flipped)])
+        self._locs.append([self._chunk_i, self._chunk_offset])
+        self._shapes.append(feat.shape)
+        self._im_scales.append(im_scale)
+        self._chunk_offset += feat.nbytes
+
+    def close(self):
+        """
+        flush the current chunk and write the index
+        """
+        if self.mode != 'w':
+            return
+        self._chunk_fp.close()
+        index = {'keys': np.array(self._keys, dtype=np.int64).reshape(-1, 3),
+                 'locs': np.array(self._locs, dtype=np.int64).reshape(-1, 2),
+                 'shapes': np.array(self._shapes, dtype=np.int64).reshape(-1, 3),
+                 'im_scales': np.array(self._im_scales, dtype=np.float64),
+                 'dtype': self.dtype.str,
+                 'scales': self.scales,
+                 'max_size': self.max_size}
+        np.save(os.path.join(self.cache_dir, INDEX_FILE), index)
+
+    def has(self, db_idx, scale_ind, flipped):
+        return (db_idx, scale_ind, int(flipped)) in self._lookup
+
+    def get(self, db_idx, scale_ind, flipped):
+        """
+        return a read-only view of a feature map and the scale factor of
+        the image it was computed from
+        """
+        i = self._lookup[(db_idx, scale_ind, int(flipped))]
+        chunk_i, offset = self._locs[i]
+        if chunk_i not in self._chunks:
+            # chunks are mapped lazily, i.e. after the data workers fork
+            self._chunks[chunk_i] = np.memmap(self._chunk_fn(chunk_i),
+                                              dtype=np.uint8, mode='r')
+        shape = tuple(self._shapes[i])
+        nbytes = int(np.prod(shape)) * self.dtype.itemsize
+        buf = self._chunks[chunk_i][offset:offset + nbytes]
+        feat = buf.view(self.dtype).reshape(shape)
+        return feat, self._im_scales[i]
@@ -1,10 +1,31 @@
+import mmap
 import multiprocessing
+import numpy as np
+
+# alignment (in bytes) of the arrays written to a batch slot
+SLOT_ALIGN = 64
+
+def _align(n):
+    return (n + SLOT_ALIGN - 1) // SLOT_ALIGN * SLOT_ALIGN
 
 class DataRunnerMP:
     """
     A multi-processing data runner for tensorflow
+
+    If shm_slots > 0, batches are passed from the workers to the main process
+    through a ring of preallocated shared memory slots of shm_slot_size
+    bytes each: a worker copies the arrays of a batch into a free slot and
+    only sends their dtypes, shapes and offsets through the data queue. The
+    main process feeds views of the slot, which is handed back to the
+    workers when the next batch is requested. Batches that do not fit into a
+    slot are pickled through the queue.
+
+    Tasks are numbered by the manager and batches are returned in task
+    order, whichever worker makes them. last_task is the task of the latest
+    batch returned by get_feed_batch.
     """
-    def __init__(self, task_func, task_generator, input_pls, capacity=100):
+    def __init__(self, task_func, task_generator, input_pls, capacity=100,
+                 shm_slots=0, shm_slot_size=0):
         self._input_pls = input_pls
         self._task_func = task_func
         self._task_generator = task_generator
@@ -14,11 +35,38 @@ class DataRunnerMP:
         self._queue_outputs = self._input_pls
         self.capacity = capacity
 
+        self._shm_slots = shm_slots
+        self._shm_slot_size = _align(shm_slot_size)
+        self._shm = None
+        self._held_slot = None
+
+        self._next_seq = 0
+        self._pending = {} # batches that arrived ahead of their turn
+        self.last_task = None
+
     def get_feed_batch(self):
         if self.counter % 100 == 0:
             print('qlen=%i' % self.data_queue.qsize())
         self.counter += 1
-        feed = self.data_queue.get()
+        # the previous batch has been consumed, hand its slot back
+        if self._held_slot is not None:
+            self.free_slots.put(self._held_slot)
+            self._held_slot = None
+        while True:
+            if self._next_seq in self._pending:
+                task, slot, feed = self._pending.pop(self._next_seq)
+            else:
+                seq, task, slot, feed = self.data_queue.get()
+                if seq != self._next_seq:
+                    self._pending[seq] = self._detach(task, slot, feed)
+                    continue
+            self._next_seq += 1
+            self.last_task = task
+            if feed is not None: # None if the task did not make a batch
+                break
+        if slot is not None:
+            feed = self._read_slot(slot, feed)
+            self._held_slot = slot
         out_feed= {}
         for k, v in feed.items():
             out_feed[self._input_pls[k]] = v
@@ -27,31 +75,92 @@ class DataRunnerMP:
     def get_inputs(self):
         return dict(self._queue_outputs)
 
+    def _slot_view(self, slot, offset, dtype, shape):
+        count = int(np.prod(shape))
+        return np.frombuffer(self._shm, dtype=dtype, count=count,
+                             offset=slot * self._shm_slot_size + offset).reshape(shape)
+
+    def _write_slot(self, slot, feed):
+        """
+        copy the arrays of a feed into a slot, return the slot layout
+        """
+        layout = {}
+        offset = 0
+        for key, v in feed.items():
+            if isinstance(v, np.ndarray):
+                self._slot_view(slot, offset, v.dtype, v.shape)[...] = v
+                layout[key] = (v.dtype.str, v.shape, offset)
+                offset += _align(v.nbytes)
+            else:
+                layout[key] = v
+        return layout
+
+    def _read_slot(self, slot, layout):
+        """
+        return a feed of (zero-copy) views of the arrays in a slot
+        """
+        feed = {}
+        for key, v in layout.items():
+            if isinstance(v, tuple):
+                dtype, shape, offset = v
+                feed[key] = self._slot_view(slot, offset, dtype, shape)
+            else:
+                feed[key] = v
+        return feed
+
+    def _detach(self, task, slot, feed):
+        """
+        copy a batch that has to wait for its turn out of its slot, so
+        that the workers do not run out of slots
+        """
+        if slot is None:
+            return task, slot, feed
+        feed = self._read_slot(slot, feed)
+        for key, v in feed.items():
+            if isinstance(v, np.ndarray):
+                feed[key] = v.copy()
+        self.free_slots.put(slot)
+        return task, None, feed
+
     def _worker_main(self, task_queue, data_queue):
         """
         generate sample from task queue and put the sample
         into a data queue in the form of tf feed_dict
         """
         while True:
-            task = task_queue.get()
+            seq, task = task_queue.get()
             sample = self._task_func(task)
             if sample is None:
+                data_queue.put((seq, task, None, None))
                 continue
             feed = {}
             for key, pl in self._input_pls.items():
                 feed[key] = sample[key]
-            data_queue.put(feed)
+
+            nbytes = sum([_align(v.nbytes) for v in feed.values()
+                          if isinstance(v, np.ndarray)])
+            if self._shm is not None and nbytes <= self._shm_slot_size:
+                slot = self.free_slots.get()
+                data_queue.put((seq, task, slot, self._write_slot(slot, feed)))
+            else:
+                data_queue.put((seq, task, None, feed))
 
     def _manager_main(self, queue):
         """
         put tasks into queue
         """
-        for task in self._task_generator():
-            queue.put(task)
+        for seq, task in enumerate(self._task_generator()):
+            queue.put((seq, task))
 
     def start_processes(self, sess, n_processes=1):
         self.task_queue = multiprocessing.Queue(self.capacity)
         self.data_queue = multiprocessing.Queue(self.capacity)
+        if self._shm_slots > 0:
+            # an anonymous shared mapping is inherited by the workers
+            self._shm = mmap.mmap(-1, self._shm_slots * self._shm_slot_size)
+            self.free_slots = multiprocessing.Queue()
+            for slot in range(self._shm_slots):
+                self.free_slots.put(slot)
         p = multiprocessing.Process(target=self._manager_main, args=(self.task_queue,))
         p.daemon = True
         p.start()
@@ -3,52 +3,60 @@ import numpy as np
 def create_graph_data(num_roi, num_rel, relations):
     """
     compute graph structure from relations
-    """
 
-    rel_mask = np.zeros((num_roi, num_rel)).astype(np.bool)
-    roi_rel_inds = np.ones((num_roi, num_roi)).astype(np.int32) * -1
-    for i, rel in enumerate(relations):
-        rel_mask[rel[0], i] = True
-        rel_mask[rel[1], i] = True
-        roi_rel_inds[rel[0], rel[1]] = i
+    rel_mask_inds, rel_segment_inds: for every roi (segment), the sorted
+        indices of the relations it takes part in, followed by a dummy
+        relation index num_rel
+    rel_pair_mask_inds, rel_pair_segment_inds: for every roi i (segment),
+        the [i->j, j->i] relation index pairs of the rois j that it is
+        connected to in both directions, followed by a dummy pair
+    """
+    relations = np.asarray(relations).reshape(-1, 2)[:num_rel]
+    sub = relations[:, 0].astype(np.int64)
+    obj = relations[:, 1].astype(np.int64)
+    rel_inds = np.arange(num_rel)
 
-    rel_mask_inds = []
-    rel_segment_inds = []
-    for i, mask in enumerate(rel_mask):
-        mask_inds = np.where(mask)[0].tolist() + [num_rel]
-        segment_inds = [i for _ in mask_inds]
-        rel_mask_inds += mask_inds
-        rel_segment_inds += segment_inds
+    # (roi, relation) incidences plus one dummy relation per roi, sorted by
+    # roi and then relation. self-loops are counted once (np.unique).
+    keys = np.hstack([sub * (num_rel + 1) + rel_inds,
+                      obj * (num_rel + 1) + rel_inds,
+                      np.arange(num_roi) * (num_rel + 1) + num_rel])
+    keys = np.unique(keys)
+    rel_mask_inds = keys % (num_rel + 1)
+    rel_segment_inds = keys // (num_rel + 1)
 
-    # compute relation pair inds
-    rel_pair_mask_inds = []  #
-    rel_pair_segment_inds = []  # for segment gather
-    for i in xrange(num_roi):
-        mask_inds = []
-        for j in xrange(num_roi):
-            out_inds = roi_rel_inds[i,j]
-            in_inds = roi_rel_inds[j,i]
-            if out_inds >= 0 and in_inds >= 0:
-                out_inds = out_inds if out_inds >=0 else num_rel
-                in_inds = in_inds if in_inds >=0 else num_rel
-                mask_inds.append([out_inds, in_inds])
+    # relation index of each (sub, obj), the last one for duplicate relations
+    roi_rel_inds = np.ones((num_roi, num_roi), dtype=np.int32) * -1
+    np.maximum.at(roi_rel_inds, (sub, obj), rel_inds.astype(np.int32))
 
-        mask_inds.append([num_rel, num_rel]) # pad with dummy edge ind
-        rel_pair_mask_inds += mask_inds
-        rel_pair_segment_inds += [i for _ in mask_inds]
+    # compute relation pair inds: rois that are connected in both directions
+    pair_i, pair_j = np.where(np.logical_and(roi_rel_inds >= 0,
+                                             roi_rel_inds.T >= 0))
+    num_pairs = pair_i.shape[0]
+    # leave room for a dummy edge after the pairs of every roi
+    pair_counts = np.bincount(pair_i, minlength=num_roi)
+    pad_pos = np.cumsum(pair_counts) + np.arange(num_roi)
+    rel_pair_mask_inds = np.ones((num_pairs + num_roi, 2), dtype=np.int32) * num_rel
+    rel_pair_segment_inds = np.zeros(num_pairs + num_roi, dtype=np.int32)
+    pair_pos = np.arange(num_pairs) + pair_i
+    rel_pair_mask_inds[pair_pos, 0] = roi_rel_inds[pair_i, pair_j]
+    rel_pair_mask_inds[pair_pos, 1] = roi_rel_inds[pair_j, pair_i]
+    rel_pair_segment_inds[pair_pos] = pair_i
+    rel_pair_segment_inds[pad_pos] = np.arange(num_roi)
 
     # sanity check
-    for i, inds in enumerate(rel_pair_mask_inds):
-        if inds[0] < num_rel:
-            assert(relations[inds[0]][0] == rel_pair_segment_inds[i])
-        if inds[1] < num_rel:
-            assert(relations[inds[1]][1] == rel_pair_segment_inds[i])
+    out_inds = rel_pair_mask_inds[:, 0]
+    in_inds = rel_pair_mask_inds[:, 1]
+    valid = out_inds < num_rel
+    assert(np.all(sub[out_inds[valid]] == rel_pair_segment_inds[valid]))
+    valid = in_inds < num_rel
+    assert(np.all(obj[in_inds[valid]] == rel_pair_segment_inds[valid]))
 
     output_dict = {
-        'rel_mask_inds': np.array(rel_mask_inds).astype(np.int32),
-        'rel_segment_inds': np.array(rel_segment_inds).astype(np.int32),
-        'rel_pair_segment_inds': np.array(rel_pair_segment_inds).astype(np.int32),
-        'rel_pair_mask_inds': np.array(rel_pair_mask_inds).astype(np.int32),
+        'rel_mask_inds': rel_mask_inds.astype(np.int32),
+        'rel_segment_inds': rel_segment_inds.astype(np.int32),
+        'rel_pair_segment_inds': rel_pair_segment_inds,
+        'rel_pair_mask_inds': rel_pair_mask_inds,
         'num_roi': num_roi,
         'num_rel': num_rel
     }
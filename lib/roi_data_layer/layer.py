@@ -1,6 +1,8 @@
 from fast_rcnn.config import cfg
-from roi_data_layer.minibatch import get_minibatch
+from roi_data_layer.minibatch import get_minibatch, sample_scale_inds
 from roi_data_layer.roidb import prepare_roidb, add_bbox_regression_targets
+from roi_data_layer.conv_cache import ConvFeatureCache
+from roi_data_layer.scale_cache import ImageScaleCache
 import numpy as np
 
 
@@ -9,50 +11,108 @@ class RoIDataLayer:
         self.imdb = imdb
         self._roidb = imdb.roidb
         self._num_classes = imdb.num_classes
+        # the sampler draws its seed from numpy.random, which is seeded with
+        # cfg.RNG_SEED unless training is randomized
+        self._seed = np.random.randint(2**31)
+        self._epoch = 0
         self._shuffle_roidb_inds()
         self.bbox_means = bbox_means
         self.bbox_stds = bbox_stds
+        self._conv_cache = None
+        if cfg.TRAIN.USE_CONV_CACHE:
+            self._conv_cache = ConvFeatureCache(cfg.TRAIN.CONV_CACHE_DIR)
+            self._conv_cache.check_config(cfg.TRAIN.SCALES, cfg.TRAIN.MAX_SIZE)
+        self._scale_cache = None
+        if cfg.TRAIN.SCALE_CACHE_DIR:
+            self._scale_cache = ImageScaleCache(cfg.TRAIN.SCALE_CACHE_DIR, imdb,
+                                                cfg.TRAIN.SCALES, cfg.TRAIN.MAX_SIZE)
 
     def _shuffle_roidb_inds(self):
         """Randomly permute the training roidb."""
+        # the permutation only depends on the seed and the epoch
+        rng = np.random.RandomState([self._seed, self._epoch])
         if cfg.TRAIN.ASPECT_GROUPING:
-            widths = np.array([r['width'] for r in self._roidb])
-            heights = np.array([r['height'] for r in self._roidb])
+            widths = self._roidb.widths
+            heights = self._roidb.heights
             horz = (widths >= heights)
             vert = np.logical_not(horz)
             horz_inds = np.where(horz)[0]
             vert_inds = np.where(vert)[0]
             inds = np.hstack((
-                np.random.permutation(horz_inds),
-                np.random.permutation(vert_inds)))
+                rng.permutation(horz_inds),
+                rng.permutation(vert_inds)))
             inds = np.reshape(inds, (-1, 2))
-            row_perm = np.random.permutation(np.arange(inds.shape[0]))
+            row_perm = rng.permutation(np.arange(inds.shape[0]))
             inds = np.reshape(inds[row_perm, :], (-1,))
             self._perm = inds
         else:
-            self._perm = np.random.permutation(np.arange(len(self._roidb)))
+            self._perm = rng.permutation(np.arange(len(self._roidb)))
         self._cur = 0
 
     def _get_next_minibatch_inds(self):
         """Return the roidb indices for the next minibatch."""
         if self._cur + cfg.TRAIN.IMS_PER_BATCH >= len(self._roidb):
+            self._epoch += 1
             self._shuffle_roidb_inds()
 
         db_inds = self._perm[self._cur:self._cur + cfg.TRAIN.IMS_PER_BATCH]
         self._cur += cfg.TRAIN.IMS_PER_BATCH
         return db_inds
 
+    def get_state(self):
+        """Return the sampler state, i.e. the position in the current epoch."""
+        return {'seed': self._seed, 'epoch': self._epoch, 'cur': self._cur}
+
+    def set_state(self, state):
+        """Continue sampling from a state returned by get_state."""
+        self._seed = state['seed']
+        self._epoch = state['epoch']
+        self._shuffle_roidb_inds()
+        self._cur = state['cur']
+
+    def next_task(self):
+        """
+        Return the roidb indices of the next minibatch together with the
+        sampler state after it, see run_task.
+        """
+        db_inds = self._get_next_minibatch_inds()
+        return db_inds, self.get_state()
+
+    def run_task(self, task):
+        """
+        Return the blobs of a minibatch task made by next_task. The random
+        sampling of a minibatch (scales, rois and relations) is seeded from
+        the sampler state, so that data workers draw independent samples and
+        a minibatch is the same no matter which worker makes it.
+        """
+        db_inds, state = task
+        np.random.seed([state['seed'], state['epoch'], state['cur']])
+        return self._get_next_minibatch(db_inds)
+
     def _get_next_minibatch(self, db_inds):
         """Return the blobs to be used for the next minibatch.
         """
+        # the scales are sampled first, to know which images are read from
+        # the scale cache
+        scale_inds = sample_scale_inds(len(db_inds))
+        if self._conv_cache is None:
+            # decode the images while the rois are sampled, unless they are
+            # read from the scale cache at their scale
+            prefetch_inds = db_inds
+            if self._scale_cache is not None:
+                prefetch_inds = [i for i, scale_ind in zip(db_inds, scale_inds)
+                                 if not self._scale_cache.has(i, cfg.TRAIN.SCALES[scale_ind])]
+            self.imdb.prefetch_images(prefetch_inds)
         minibatch_db = [self._roidb[i] for i in db_inds]
         if cfg.TRAIN.USE_RPN_DB:
-            minibatch_db = self.imdb.add_rpn_rois(minibatch_db)
+            # roidb entries are built on access, no need to copy them
+            minibatch_db = self.imdb.add_rpn_rois(minibatch_db, make_copy=False)
         prepare_roidb(minibatch_db)
         add_bbox_regression_targets(minibatch_db, self.bbox_means,
                                     self.bbox_stds)
 
-        blobs = get_minibatch(minibatch_db, self._num_classes)
+        blobs = get_minibatch(minibatch_db, self._num_classes, self._conv_cache,
+                              self._scale_cache, scale_inds)
         if blobs is not None:
             blobs['db_inds'] = db_inds
         return blobs
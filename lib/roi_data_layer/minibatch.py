@@ -14,12 +14,25 @@ import data_utils
 from IPython import embed
 from utils.timer import Timer
 
-def get_minibatch(roidb, num_classes):
-    """Given a mini batch of roidb, construct a data blob from it."""
+def sample_scale_inds(num_images):
+    """Sample random scales (indices into cfg.TRAIN.SCALES) for the images
+    of a minibatch."""
+    return npr.randint(0, high=len(cfg.TRAIN.SCALES), size=num_images)
+
+def get_minibatch(roidb, num_classes, conv_cache=None, scale_cache=None,
+                  scale_inds=None):
+    """Given a mini batch of roidb, construct a data blob from it.
+
+    If a ConvFeatureCache is given, the blob holds the precomputed conv
+    feature maps ('conv_out') of the images instead of the images ('ims').
+    If an ImageScaleCache is given, the images are read from it already
+    resized where possible. The scales of the images are sampled with
+    sample_scale_inds unless given.
+    """
     num_images = len(roidb)
     # Sample random scales to use for each image in this batch
-    random_scale_inds = npr.randint(0, high=len(cfg.TRAIN.SCALES),
-                                    size=num_images)
+    if scale_inds is None:
+        scale_inds = sample_scale_inds(num_images)
     assert(cfg.TRAIN.BATCH_SIZE % num_images == 0), \
         'num_images ({}) must divide BATCH_SIZE ({})'. \
         format(num_images, cfg.TRAIN.BATCH_SIZE)
@@ -28,11 +41,14 @@ def get_minibatch(roidb, num_classes):
 
     im_timer = Timer()
     im_timer.tic()
-    im_blob, im_scales = _get_image_blob(roidb, random_scale_inds)
+    if conv_cache is not None:
+        conv_blob, im_scales = _get_conv_blob(roidb, scale_inds, conv_cache)
+        blobs = {'conv_out': conv_blob}
+    else:
+        im_blob, im_scales = _get_image_blob(roidb, scale_inds, scale_cache)
+        blobs = {'ims': im_blob}
     im_timer.toc()
 
-    blobs = {'ims': im_blob}
-
     # Now, build the region of interest and label blobs
     rois_blob = np.zeros((0, 5), dtype=np.float32)
     labels_blob = np.zeros((0), dtype=np.float32)
@@ -93,6 +109,10 @@ def get_minibatch(roidb, num_classes):
         np.array(bbox_inside_blob > 0).astype(np.float32).copy()
 
 
+    if cfg.GRAPH_DATA_IN_TF:
+        # computed by the network from rois and relations
+        return blobs
+
     num_roi = rois_blob.shape[0]
     num_rel = rels_blob.shape[0]
     blobs['rel_rois'] = data_utils.compute_rel_rois(num_rel,
@@ -248,7 +268,7 @@ def _sample_bg_rois(roidb, num_bg_rois):
 
     return bg_inds
 
-def _get_image_blob(roidb, scale_inds):
+def _get_image_blob(roidb, scale_inds, scale_cache=None):
     """Builds an input blob from the images in the roidb at the specified
     scales.
     """
@@ -256,11 +276,22 @@ def _get_image_blob(roidb, scale_inds):
     processed_ims = []
     im_scales = []
     for i in xrange(num_images):
+        target_size = cfg.TRAIN.SCALES[scale_inds[i]]
+        if scale_cache is not None and \
+                scale_cache.has(roidb[i]['db_idx'], target_size):
+            # already resized, only subtract the means
+            im, im_scale = scale_cache.get(roidb[i]['db_idx'], target_size)
+            if roidb[i]['flipped']:
+                im = im[:, ::-1, :]
+            im = np.subtract(im, cfg.PIXEL_MEANS, dtype=np.float32)
+            im_scales.append(im_scale)
+            processed_ims.append(im)
+            continue
+
         im = roidb[i]['image']() # use image getter
 
         if roidb[i]['flipped']:
             im = im[:, ::-1, :]
-        target_size = cfg.TRAIN.SCALES[scale_inds[i]]
         im, im_scale = prep_im_for_blob(im, cfg.PIXEL_MEANS, target_size,
                                         cfg.TRAIN.MAX_SIZE)
         im_scales.append(im_scale)
@@ -271,6 +302,28 @@ def _get_image_blob(roidb, scale_inds):
 
     return blob, im_scales
 
+def _get_conv_blob(roidb, scale_inds, conv_cache):
+    """Builds a blob of precomputed conv feature maps of the images in the
+    roidb at the specified scales.
+    """
+    num_images = len(roidb)
+    feats = []
+    im_scales = []
+    for i in xrange(num_images):
+        feat, im_scale = conv_cache.get(roidb[i]['db_idx'], scale_inds[i],
+                                        roidb[i]['flipped'])
+        feats.append(feat)
+        im_scales.append(im_scale)
+
+    # zero-pad the feature maps to the same size
+    max_shape = np.array([feat.shape for feat in feats]).max(axis=0)
+    blob = np.zeros((num_images, max_shape[0], max_shape[1], max_shape[2]),
+                    dtype=np.float32)
+    for i, feat in enumerate(feats):
+        blob[i, 0:feat.shape[0], 0:feat.shape[1], :] = feat
+
+    return blob, im_scales
+
 def _project_im_rois(im_rois, im_scale_factor):
     """Project image RoIs into the rescaled training image."""
     rois = im_rois * im_scale_factor
@@ -36,6 +36,16 @@ def prepare_roidb(roidb_batch):
         nonzero_inds = np.where(max_overlaps > 0)[0]
         assert all(max_classes[nonzero_inds] != 0)
 
+def prepare_test_roidb_entry(imdb, entry):
+    """
+    add the RPN proposals and the derived quantities (see prepare_roidb)
+    to the roidb entry of a test image
+    """
+    if cfg.TEST.USE_RPN_DB:
+        entry = imdb.add_rpn_rois([entry], make_copy=False)[0]
+    prepare_roidb([entry])
+    return entry
+
 def compute_bbox_target_normalization(roidb):
     num_images = len(roidb)
     # Infer number of classes from the number of columns in gt_overlaps
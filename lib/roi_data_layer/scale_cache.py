@@ -0,0 +1,120 @@
+# --------------------------------------------------------
+# Scene Graph Generation by Iterative Message Passing
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""
+A store of the training images resized to the training scales, as uint8.
+
+prep_im_for_blob converts an image to float32, subtracts the pixel means
+and resizes it to a training scale, again for every epoch and for the
+flipped copy of the image. With the store, the data workers only subtract
+the means and flip. Bilinear resizing commutes with the mean subtraction
+and with horizontal flips, so the blobs only differ by the rounding of the
+stored images to uint8 (at most 0.5).
+
+The images are keyed by their row in the image database, so one store
+serves every split of a dataset. The store of a scale is a uint8
+ConvFeatureCache (see conv_cache.py) in
+
+    <cache_dir>/<dataset version>/scale<target size>_max<max size>_<backend>/
+
+so a change of the scales, of MAX_SIZE, of RESIZE_BACKEND or of the image
+database (see vg_hdf5.image_db_version) uses a different store.
+"""
+
+import os
+import multiprocessing
+import numpy as np
+
+from fast_rcnn.config import cfg
+from roi_data_layer.conv_cache import ConvFeatureCache, INDEX_FILE
+from utils.blob import prep_im_for_blob
+from utils.timer import Timer
+
+
+def _store_dir(cache_dir, imdb, target_size, max_size):
+    return os.path.join(cache_dir, imdb.image_db_version(),
+                        'scale%i_max%i_%s' % (target_size, max_size,
+                                              cfg.RESIZE_BACKEND))
+
+
+def resize_image(im, target_size, max_size):
+    """
+    resize an image like prep_im_for_blob, without the mean subtraction,
+    and round it to uint8
+    """
+    im, im_scale = prep_im_for_blob(im, np.zeros(3, dtype=np.float32),
+                                    target_size, max_size)
+    return np.round(im).astype(np.uint8), im_scale
+
+
+class ImageScaleCache(object):
+
+    def __init__(self, cache_dir, imdb, scales, max_size):
+        """
+        open the stores of the given scales that have been built, images of
+        the other scales are not cached (see has)
+        """
+        self._image_index = imdb.image_index
+        self._stores = {}
+        for target_size in scales:
+            store_dir = _store_dir(cache_dir, imdb, target_size, max_size)
+            if os.path.exists(os.path.join(store_dir, INDEX_FILE)):
+                self._stores[target_size] = ConvFeatureCache(store_dir)
+            else:
+                print('no image cache for scale %i in %s' % (target_size, store_dir))
+
+    def has(self, db_idx, target_size):
+        if target_size not in self._stores:
+            return False
+        return self._stores[target_size].has(int(self._image_index[db_idx]), 0, False)
+
+    def get(self, db_idx, target_size):
+        """
+        return a read-only view of the resized image (uint8, BGR) and its
+        scale factor
+        """
+        return self._stores[target_size].get(int(self._image_index[db_idx]), 0, False)
+
+
+_build_imdb = None
+
+def _resize_all_scales(args):
+    # runs in the build_scale_cache workers, which inherit _build_imdb
+    im_i, scales, max_size = args
+    im = _build_imdb.im_getter(im_i)
+    return [resize_image(im, target_size, max_size) for target_size in scales]
+
+
+def build_scale_cache(imdb, cache_dir, scales, max_size, num_workers=1):
+    """
+    resize the images of imdb to the given scales and write them to the
+    stores of ImageScaleCache in cache_dir
+    """
+    global _build_imdb
+    _build_imdb = imdb
+    stores = [ConvFeatureCache(_store_dir(cache_dir, imdb, target_size, max_size),
+                               mode='w', dtype=np.uint8, scales=(target_size,),
+                               max_size=max_size)
+              for target_size in scales]
+
+    num_images = imdb.num_images
+    pool = multiprocessing.Pool(max(num_workers, 1))
+    tasks = [(im_i, scales, max_size) for im_i in xrange(num_images)]
+    timer = Timer()
+    timer.tic()
+    for im_i, resized in enumerate(pool.imap(_resize_all_scales, tasks, chunksize=8)):
+        for store, (im, im_scale) in zip(stores, resized):
+            store.add(int(imdb.image_index[im_i]), 0, False, im_scale, im)
+        if (im_i + 1) % 1000 == 0:
+            timer.toc()
+            print 'resize: {:d}/{:d} {:.3f}s'.format(im_i + 1, num_images,
+                                                    timer.total_time / (im_i + 1))
+            timer.tic()
+    pool.close()
+    pool.join()
+
+    for store in stores:
+        store.close()
+    print 'Wrote {:d} images at scales {} to {:s}'.format(num_images, scales, cache_dir)
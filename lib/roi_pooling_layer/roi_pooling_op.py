@@ -2,11 +2,24 @@ import tensorflow as tf
 import os.path as osp
 import os
 
-op_file = 'roi_pooling_op_gpu_cuda8.so'  # for CUDA 8
-#op_file = 'roi_pooling_op_gpu.so' # CUDA 7.5
+op_file = 'roi_pooling_op_gpu.so' # GPU and CPU kernels (see README.md)
+cpu_op_file = 'roi_pooling_op.so' # CPU-only build
 
-filename = osp.join(osp.dirname(__file__), op_file)
-
-_roi_pooling_module = tf.load_op_library(filename)
+# load the first library that loads: the GPU build needs the CUDA runtime,
+# which CPU-only machines may not have
+_roi_pooling_module = None
+for op_name in [op_file, cpu_op_file]:
+    filename = osp.join(osp.dirname(__file__), op_name)
+    if not osp.exists(filename):
+        continue
+    try:
+        _roi_pooling_module = tf.load_op_library(filename)
+        break
+    except tf.errors.NotFoundError as e:
+        print('Could not load %s: %s' % (filename, e))
+if _roi_pooling_module is None:
+    raise ImportError('No RoI pooling library (%s or %s) could be loaded from %s, '
+                      'see README.md to build it' %
+                      (op_file, cpu_op_file, osp.dirname(__file__)))
 roi_pool = _roi_pooling_module.roi_pool
 roi_pool_grad = _roi_pooling_module.roi_pool_grad
@@ -22,6 +22,13 @@ limitations under the License.
 #include "tensorflow/core/framework/op.h"
 #include "tensorflow/core/framework/op_kernel.h"
 #include "tensorflow/core/framework/tensor_shape.h"
+#include "tensorflow/core/util/work_sharder.h"
+
+// The GPU kernels are only compiled with -D GOOGLE_CUDA=1, without it this
+// is the CPU-only build (roi_pooling_op.so, see ../README.md)
+#if !GOOGLE_CUDA
+#warning "GOOGLE_CUDA is not set, building the CPU kernels only"
+#endif
 
 using namespace tensorflow;
 typedef Eigen::ThreadPoolDevice CPUDevice;
@@ -115,88 +122,102 @@ class RoiPoolOp : public OpKernel {
     OP_REQUIRES_OK(context, context->allocate_output(1, output_shape, &argmax_tensor));
     auto argmax = argmax_tensor->template flat<int>();
 
-    // Set all element of the output tensor to -inf.
-    const int N = output.size();
-    for (int i = 0; i < N; i++) 
-    {
-      output(i) = -FLT_MAX;
-      argmax(i) = -1;
-    }
-
-    // For each ROI R = [batch_index x1 y1 x2 y2]: max pool over R
-    int index_roi = 0;
-    int index_output = 0;
-    for (int n = 0; n < num_rois; ++n) 
-    {
-      int roi_batch_ind = bottom_rois_flat(index_roi + 0);
-      int roi_start_w = round(bottom_rois_flat(index_roi + 1) * spatial_scale_);
-      int roi_start_h = round(bottom_rois_flat(index_roi + 2) * spatial_scale_);
-      int roi_end_w = round(bottom_rois_flat(index_roi + 3) * spatial_scale_);
-      int roi_end_h = round(bottom_rois_flat(index_roi + 4) * spatial_scale_);
-      CHECK_GE(roi_batch_ind, 0);
-      CHECK_LT(roi_batch_ind, batch_size);
-
-      int roi_height = std::max(roi_end_h - roi_start_h + 1, 1);
-      int roi_width = std::max(roi_end_w - roi_start_w + 1, 1);
-      const T bin_size_h = static_cast<T>(roi_height) / static_cast<T>(pooled_height_);
-      const T bin_size_w = static_cast<T>(roi_width) / static_cast<T>(pooled_width_);
-
-      int index_data = roi_batch_ind * data_height * data_width * num_channels;
-
-      for (int ph = 0; ph < pooled_height_; ++ph) 
+    const int roi_dims = bottom_rois.dim_size(1);
+    const int output_roi_size = pooled_height_ * pooled_width_ * num_channels;
+    const int pooled_height = pooled_height_;
+    const int pooled_width = pooled_width_;
+    const float spatial_scale = spatial_scale_;
+
+    // For each ROI R = [batch_index x1 y1 x2 y2]: max pool over R. The ROIs
+    // write disjoint parts of the output, so they are split between the
+    // threads of the intra-op thread pool.
+    auto pool_rois = [&](int64 start, int64 limit) {
+      for (int n = start; n < limit; ++n)
       {
-        for (int pw = 0; pw < pooled_width_; ++pw) 
+        const int index_roi = n * roi_dims;
+        const int index_output = n * output_roi_size;
+
+        // Set all element of the output of this ROI to -inf.
+        for (int i = 0; i < output_roi_size; i++)
         {
-          // Compute pooling region for this output unit:
-          //  start (included) = floor(ph * roi_height / pooled_height_)
-          //  end (excluded) = ceil((ph + 1) * roi_height / pooled_height_)
-          int hstart = static_cast<int>(floor(static_cast<T>(ph)
-                                              * bin_size_h));
-          int wstart = static_cast<int>(floor(static_cast<T>(pw)
-                                              * bin_size_w));
-          int hend = static_cast<int>(ceil(static_cast<T>(ph + 1)
-                                           * bin_size_h));
-          int wend = static_cast<int>(ceil(static_cast<T>(pw + 1)
-                                           * bin_size_w));
-
-          hstart = std::min(std::max(hstart + roi_start_h, 0), data_height);
-          hend = std::min(std::max(hend + roi_start_h, 0), data_height);
-          wstart = std::min(std::max(wstart + roi_start_w, 0), data_width);
-          wend = std::min(std::max(wend + roi_start_w, 0), data_width);
-
-          bool is_empty = (hend <= hstart) || (wend <= wstart);
-
-          const int pool_index = index_output + (ph * pooled_width_ + pw) * num_channels;
-          if (is_empty) 
+          output(index_output + i) = -FLT_MAX;
+          argmax(index_output + i) = -1;
+        }
+
+        int roi_batch_ind = bottom_rois_flat(index_roi + 0);
+        int roi_start_w = round(bottom_rois_flat(index_roi + 1) * spatial_scale);
+        int roi_start_h = round(bottom_rois_flat(index_roi + 2) * spatial_scale);
+        int roi_end_w = round(bottom_rois_flat(index_roi + 3) * spatial_scale);
+        int roi_end_h = round(bottom_rois_flat(index_roi + 4) * spatial_scale);
+        CHECK_GE(roi_batch_ind, 0);
+        CHECK_LT(roi_batch_ind, batch_size);
+
+        int roi_height = std::max(roi_end_h - roi_start_h + 1, 1);
+        int roi_width = std::max(roi_end_w - roi_start_w + 1, 1);
+        const T bin_size_h = static_cast<T>(roi_height) / static_cast<T>(pooled_height);
+        const T bin_size_w = static_cast<T>(roi_width) / static_cast<T>(pooled_width);
+
+        int index_data = roi_batch_ind * data_height * data_width * num_channels;
+
+        for (int ph = 0; ph < pooled_height; ++ph)
+        {
+          for (int pw = 0; pw < pooled_width; ++pw)
           {
-            for (int c = 0; c < num_channels; ++c) 
+            // Compute pooling region for this output unit:
+            //  start (included) = floor(ph * roi_height / pooled_height_)
+            //  end (excluded) = ceil((ph + 1) * roi_height / pooled_height_)
+            int hstart = static_cast<int>(floor(static_cast<T>(ph)
+                                                * bin_size_h));
+            int wstart = static_cast<int>(floor(static_cast<T>(pw)
+                                                * bin_size_w));
+            int hend = static_cast<int>(ceil(static_cast<T>(ph + 1)
+                                             * bin_size_h));
+            int wend = static_cast<int>(ceil(static_cast<T>(pw + 1)
+                                             * bin_size_w));
+
+            hstart = std::min(std::max(hstart + roi_start_h, 0), data_height);
+            hend = std::min(std::max(hend + roi_start_h, 0), data_height);
+            wstart = std::min(std::max(wstart + roi_start_w, 0), data_width);
+            wend = std::min(std::max(wend + roi_start_w, 0), data_width);
+
+            bool is_empty = (hend <= hstart) || (wend <= wstart);
+
+            const int pool_index = index_output + (ph * pooled_width + pw) * num_channels;
+            if (is_empty)
             {
-              output(pool_index + c) = 0;
-              argmax(pool_index + c) = -1;
+              for (int c = 0; c < num_channels; ++c)
+              {
+                output(pool_index + c) = 0;
+                argmax(pool_index + c) = -1;
+              }
             }
-          }
 
-          for (int h = hstart; h < hend; ++h) 
-          {
-            for (int w = wstart; w < wend; ++w) 
+            for (int h = hstart; h < hend; ++h)
             {
-              for (int c = 0; c < num_channels; ++c)
+              for (int w = wstart; w < wend; ++w)
               {
-                const int index = (h * data_width + w) * num_channels + c;
-                if (bottom_data_flat(index_data + index) > output(pool_index + c)) 
+                for (int c = 0; c < num_channels; ++c)
                 {
-                  output(pool_index + c) = bottom_data_flat(index_data + index);
-                  argmax(pool_index + c) = index;
+                  const int index = (h * data_width + w) * num_channels + c;
+                  if (bottom_data_flat(index_data + index) > output(pool_index + c))
+                  {
+                    output(pool_index + c) = bottom_data_flat(index_data + index);
+                    argmax(pool_index + c) = index;
+                  }
                 }
               }
             }
           }
         }
       }
-      // Increment ROI index
-      index_roi += bottom_rois.dim_size(1);
-      index_output += pooled_height_ * pooled_width_ * num_channels;
-    }
+    };
+
+    // rough cost of a ROI: every output unit reads a bin of about
+    // (roi area / number of bins) input units
+    const int64 cost_per_roi = 10 * output_roi_size;
+    auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+    Shard(worker_threads->num_threads, worker_threads->workers, num_rois,
+          cost_per_roi, pool_rois);
   }
  private:
   int pooled_height_;
@@ -207,6 +228,123 @@ class RoiPoolOp : public OpKernel {
 REGISTER_KERNEL_BUILDER(Name("RoiPool").Device(DEVICE_CPU).TypeConstraint<float>("T"), RoiPoolOp<CPUDevice, float>);
 REGISTER_KERNEL_BUILDER(Name("RoiPool").Device(DEVICE_CPU).TypeConstraint<double>("T"), RoiPoolOp<CPUDevice, double>);
 
+// compute gradient on the cpu
+template <class Device, class T>
+class RoiPoolGradOp : public OpKernel {
+ public:
+  explicit RoiPoolGradOp(OpKernelConstruction* context) : OpKernel(context) {
+
+    // Get the pool height
+    OP_REQUIRES_OK(context,
+                   context->GetAttr("pooled_height", &pooled_height_));
+    // Check that pooled_height is positive
+    OP_REQUIRES(context, pooled_height_ >= 0,
+                errors::InvalidArgument("Need pooled_height >= 0, got ",
+                                        pooled_height_));
+    // Get the pool width
+    OP_REQUIRES_OK(context,
+                   context->GetAttr("pooled_width", &pooled_width_));
+    // Check that pooled_width is positive
+    OP_REQUIRES(context, pooled_width_ >= 0,
+                errors::InvalidArgument("Need pooled_width >= 0, got ",
+                                        pooled_width_));
+    // Get the spatial scale
+    OP_REQUIRES_OK(context,
+                   context->GetAttr("spatial_scale", &spatial_scale_));
+  }
+
+  void Compute(OpKernelContext* context) override
+  {
+    // Grab the input tensor
+    const Tensor& bottom_data = context->input(0);
+    const Tensor& bottom_rois = context->input(1);
+    const Tensor& argmax_data = context->input(2);
+    const Tensor& out_backprop = context->input(3);
+    auto bottom_rois_flat = bottom_rois.flat<T>();
+    auto argmax = argmax_data.flat<int>();
+    auto top_diff = out_backprop.flat<T>();
+
+    // data should have 4 dimensions.
+    OP_REQUIRES(context, bottom_data.dims() == 4,
+                errors::InvalidArgument("data must be 4-dimensional"));
+
+    // rois should have 2 dimensions.
+    OP_REQUIRES(context, bottom_rois.dims() == 2,
+                errors::InvalidArgument("rois must be 2-dimensional"));
+
+    OP_REQUIRES(context, argmax_data.dims() == 4,
+                errors::InvalidArgument("argmax_data must be 4-dimensional"));
+
+    OP_REQUIRES(context, out_backprop.dims() == 4,
+                errors::InvalidArgument("out_backprop must be 4-dimensional"));
+
+    // Number of ROIs
+    int num_rois = bottom_rois.dim_size(0);
+    // batch size
+    int batch_size = bottom_data.dim_size(0);
+    // data height
+    int height = bottom_data.dim_size(1);
+    // data width
+    int width = bottom_data.dim_size(2);
+    // Number of channels
+    int channels = bottom_data.dim_size(3);
+
+    // construct the output shape
+    TensorShape output_shape = bottom_data.shape();
+
+    Tensor* output_tensor = NULL;
+    OP_REQUIRES_OK(context, context->allocate_output(0, output_shape, &output_tensor));
+    auto bottom_diff = output_tensor->template flat<T>();
+    bottom_diff.device(context->eigen_device<CPUDevice>()) = bottom_diff.constant(T(0));
+
+    const int roi_dims = bottom_rois.dim_size(1);
+    const int pooled_size = pooled_height_ * pooled_width_;
+    const int image_size = height * width * channels;
+
+    // Add the gradient of every pooled unit to the input unit it pooled
+    // (argmax, an index into the image of the ROI, -1 if none). Units of
+    // different channels never pool the same input, so the channels are
+    // split between the threads; each thread adds the ROIs in order, like
+    // the gpu kernel.
+    auto backprop_channels = [&](int64 start, int64 limit) {
+      for (int n = 0; n < num_rois; ++n)
+      {
+        int roi_batch_ind = bottom_rois_flat(n * roi_dims);
+        CHECK_GE(roi_batch_ind, 0);
+        CHECK_LT(roi_batch_ind, batch_size);
+        const int index_data = roi_batch_ind * image_size;
+        const int index_output = n * pooled_size * channels;
+        for (int p = 0; p < pooled_size; ++p)
+        {
+          const int pool_index = index_output + p * channels;
+          for (int c = start; c < limit; ++c)
+          {
+            const int index = argmax(pool_index + c);
+            if (index >= 0)
+            {
+              bottom_diff(index_data + index) += top_diff(pool_index + c);
+            }
+          }
+        }
+      }
+    };
+
+    const int64 cost_per_channel = num_rois * pooled_size;
+    auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+    Shard(worker_threads->num_threads, worker_threads->workers, channels,
+          cost_per_channel, backprop_channels);
+  }
+ private:
+  int pooled_height_;
+  int pooled_width_;
+  float spatial_scale_;
+};
+
+REGISTER_KERNEL_BUILDER(Name("RoiPoolGrad").Device(DEVICE_CPU).TypeConstraint<float>("T"), RoiPoolGradOp<CPUDevice, float>);
+REGISTER_KERNEL_BUILDER(Name("RoiPoolGrad").Device(DEVICE_CPU).TypeConstraint<double>("T"), RoiPoolGradOp<CPUDevice, double>);
+
+#if GOOGLE_CUDA
+
 bool ROIPoolForwardLaucher(
     const float* bottom_data, const float spatial_scale, const int num_rois, const int height,
     const int width, const int channels, const int pooled_height,
@@ -333,9 +471,11 @@ static void RoiPoolingGradKernel(
 
 
 // compute gradient
-template <class Device, class T>
-class RoiPoolGradOp : public OpKernel {
+template <class T>
+class RoiPoolGradOp<Eigen::GpuDevice, T> : public OpKernel {
  public:
+  typedef Eigen::GpuDevice Device;
+
   explicit RoiPoolGradOp(OpKernelConstruction* context) : OpKernel(context) {
 
     // Get the pool height
@@ -406,3 +546,5 @@ class RoiPoolGradOp : public OpKernel {
 };
 
 REGISTER_KERNEL_BUILDER(Name("RoiPoolGrad").Device(DEVICE_GPU).TypeConstraint<float>("T"), RoiPoolGradOp<Eigen::GpuDevice, float>);
+
+#endif  // GOOGLE_CUDA
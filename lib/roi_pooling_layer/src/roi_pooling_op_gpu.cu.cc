@@ -1,3 +1,7 @@
+#if !GOOGLE_CUDA
+#error "roi_pooling_op_gpu.cu.cc is the GPU build, compile it with -D GOOGLE_CUDA=1"
+#endif
+
 #if GOOGLE_CUDA
 
 #define EIGEN_USE_GPU
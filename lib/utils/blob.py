@@ -9,7 +9,7 @@
 
 import numpy as np
 import scipy.ndimage
-#import cv2
+from fast_rcnn.config import cfg
 
 def im_list_to_blob(ims):
     """Convert a list of images into a network input.
@@ -36,9 +36,70 @@ def prep_im_for_blob(im, pixel_means, target_size, max_size):
     # Prevent the biggest axis from being more than MAX_SIZE
     if np.round(im_scale * im_size_max) > max_size:
         im_scale = float(max_size) / float(im_size_max)
-    #im = cv2.resize(im, None, None, fx=im_scale, fy=im_scale,
-    #                interpolation=cv2.INTER_LINEAR)
     # sample by bilinear filter
-    im = scipy.ndimage.interpolation.zoom(im, (im_scale, im_scale, 1.0), order=1)
+    im = resize_im(im, im_scale)
 
     return im, im_scale
+
+def _linear_coords(in_size, out_size):
+    # sample positions of scipy.ndimage.zoom (the corner pixels of the input
+    # and the output are aligned): lower neighbours, upper neighbours and
+    # the weights of the upper ones
+    if out_size > 1:
+        x = np.arange(out_size) * (float(in_size - 1) / (out_size - 1))
+    else:
+        x = np.zeros(1)
+    lo = np.minimum(x.astype(np.intp), max(in_size - 2, 0))
+    hi = np.minimum(lo + 1, in_size - 1)
+    return lo, hi, (x - lo).astype(np.float32)
+
+def _resize_numpy(im, out_h, out_w):
+    # separable bilinear interpolation, rows first (np.take is much faster
+    # than fancy indexing, and faster still on the flattened columns)
+    lo, hi, w = _linear_coords(im.shape[0], out_h)
+    rows = np.take(im, hi, axis=0)
+    top = np.take(im, lo, axis=0)
+    rows -= top
+    rows *= w[:, np.newaxis, np.newaxis]
+    rows += top
+
+    lo, hi, w = _linear_coords(im.shape[1], out_w)
+    num_channels = im.shape[2]
+    channels = np.arange(num_channels)
+    rows = rows.reshape(out_h, -1)
+    out = np.take(rows, (hi[:, np.newaxis] * num_channels + channels).ravel(), axis=1)
+    left = np.take(rows, (lo[:, np.newaxis] * num_channels + channels).ravel(), axis=1)
+    out -= left
+    out *= np.repeat(w, num_channels)
+    out += left
+    return out.reshape(out_h, out_w, num_channels)
+
+def _resize_pil(im, out_h, out_w):
+    from PIL import Image
+    channels = [np.asarray(Image.fromarray(np.ascontiguousarray(im[:, :, c]))
+                           .resize((out_w, out_h), Image.BILINEAR))
+                for c in xrange(im.shape[2])]
+    return np.stack(channels, axis=2)
+
+def _resize_cv2(im, out_h, out_w):
+    import cv2
+    return cv2.resize(im, (out_w, out_h), interpolation=cv2.INTER_LINEAR)
+
+def resize_im(im, im_scale):
+    """
+    Bilinearly resize a float32 (H, W, C) image by im_scale with the backend
+    of cfg.RESIZE_BACKEND. The output size is that of
+    scipy.ndimage.zoom, (round(H * im_scale), round(W * im_scale)).
+    """
+    out_h = int(round(im.shape[0] * im_scale))
+    out_w = int(round(im.shape[1] * im_scale))
+    backend = cfg.RESIZE_BACKEND
+    if backend == 'scipy':
+        return scipy.ndimage.interpolation.zoom(im, (im_scale, im_scale, 1.0), order=1)
+    elif backend == 'numpy':
+        return _resize_numpy(im, out_h, out_w)
+    elif backend == 'pil':
+        return _resize_pil(im, out_h, out_w)
+    elif backend == 'cv2':
+        return _resize_cv2(im, out_h, out_w)
+    raise ValueError('Unknown resize backend: %s' % backend)
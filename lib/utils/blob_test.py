@@ -0,0 +1,70 @@
+"""
+Check that the 'numpy' resize backend of utils.blob.resize_im matches the
+'scipy' one (scipy.ndimage.zoom), and that resizing commutes with
+horizontal flips, which the training image scale cache relies on (it
+stores the resized image and flips it afterwards).
+
+scipy.ndimage.zoom (before scipy 1.6) sets the last row or column to 0
+when the float sample position of the input edge comes out slightly past
+it; the numpy backend does not reproduce that, so such edges are only
+accepted where the scipy edge is all zero.
+
+Run from lib/: python utils/blob_test.py
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+from fast_rcnn.config import cfg
+from utils.blob import resize_im
+
+# maximum absolute difference (pixel values in [0, 255]) that counts as equal
+EQUIV_TOL = 1e-3
+
+def random_image(height, width):
+    coarse = np.random.rand(height // 16 + 2, width // 16 + 2, 3) * 255
+    im = coarse.repeat(16, axis=0).repeat(16, axis=1)[:height, :width]
+    im += np.random.randn(height, width, 3) * 10
+    return np.clip(im, 0, 255).astype(np.uint8).astype(np.float32)
+
+def resize(im, im_scale, backend):
+    cfg.RESIZE_BACKEND = backend
+    return resize_im(im, im_scale)
+
+def check_edge(diff, ref_edge):
+    # a last row / column that differs must be one that scipy zeroed
+    return diff.max() < EQUIV_TOL or not ref_edge.any()
+
+np.random.seed(3)
+shapes = [(768, 1024), (1024, 683), (333, 500), (37, 61), (480, 640)]
+scales = [600. / 768, 1000. / 1024, 600. / 333, 1.7, 0.31]
+failures = 0
+max_diff = 0.
+for (h, w), im_scale in zip(shapes, scales):
+    im = random_image(h, w)
+    ref = resize(im, im_scale, 'scipy')
+    out = resize(im, im_scale, 'numpy')
+    if out.shape != ref.shape:
+        print('FAIL %s x %.3f: shape %s, scipy %s' % ((h, w), im_scale, out.shape, ref.shape))
+        failures += 1
+        continue
+    diff = np.abs(out - ref)
+    interior = diff[:-1, :-1].max()
+    max_diff = max(max_diff, interior)
+    ok = interior < EQUIV_TOL and check_edge(diff[-1], ref[-1]) and \
+         check_edge(diff[:, -1], ref[:, -1])
+
+    # resize(flip(im)) == flip(resize(im)); scipy's zeroed last column
+    # becomes the first one of the flipped output, leave both out for it
+    flip_numpy = np.abs(resize(im[:, ::-1], im_scale, 'numpy') - out[:, ::-1]).max()
+    flip_scipy = np.abs(resize(im[:, ::-1], im_scale, 'scipy') -
+                        ref[:, ::-1])[:, 1:-1].max()
+    ok = ok and flip_numpy < EQUIV_TOL and flip_scipy < EQUIV_TOL
+
+    print('%s %s x %.3f: max diff %.2e, flip max diff numpy %.2e scipy %.2e' %
+          ('ok  ' if ok else 'FAIL', (h, w), im_scale, interior, flip_numpy, flip_scipy))
+    failures += not ok
+
+print('max interior diff %.2e, %i failures' % (max_diff, failures))
+sys.exit(1 if failures else 0)
@@ -0,0 +1,156 @@
+"""NumPy arrays (and a cache of arrays) that forked processes share without copying."""
+
+import mmap
+import multiprocessing
+import numpy as np
+
+
+def share_array(arr, memo=None):
+    """
+    Copy an array into an anonymous shared memory mapping and return a
+    read-only view of it. The mapping is inherited by processes forked
+    afterwards, which read the same physical pages.
+
+    memo: an optional dict that maps arrays that have already been shared
+    to their shared copies, so that an array referenced from several places
+    is only shared once
+    """
+    if memo is not None and id(arr) in memo:
+        return memo[id(arr)][1]
+    src = np.ascontiguousarray(arr)
+    buf = mmap.mmap(-1, max(src.nbytes, 1))
+    shared = np.frombuffer(buf, dtype=src.dtype, count=src.size)
+    shared = shared.reshape(src.shape)
+    shared[...] = src
+    shared.flags.writeable = False
+    if memo is not None:
+        # keep the original alive so that its id is not reused
+        memo[id(arr)] = (arr, shared)
+    return shared
+
+
+def memmap_h5_dataset(dset):
+    """
+    Map a contiguous, uncompressed HDF5 dataset read-only into memory.
+    Unlike an h5py dataset, the map can be read from forked processes.
+    Returns None if the layout of the dataset does not allow it.
+    """
+    if dset.chunks is not None or dset.compression is not None:
+        return None
+    offset = dset.id.get_offset()
+    if offset is None: # not allocated
+        return None
+    return np.memmap(dset.file.filename, dtype=dset.dtype, mode='r',
+                     offset=offset, shape=dset.shape)
+
+
+class SharedLRUCache(object):
+    """
+    A byte-bounded LRU cache of arrays in anonymous shared memory, created
+    before forking and shared by the forked processes (e.g. the data
+    workers). The arrays are keyed by integers in [0, num_keys) and stored
+    in chains of fixed-size blocks, so that arrays of any size fit without
+    fragmentation; the least recently used arrays are evicted to make room.
+    All arrays have the same dtype and number of dimensions.
+    """
+
+    def __init__(self, num_keys, capacity, dtype=np.uint8, ndim=3,
+                 block_size=2**16):
+        """
+        capacity: size of the cache in bytes
+        """
+        self.dtype = np.dtype(dtype)
+        self.block_size = block_size
+        self.num_blocks = max(capacity // block_size, 1)
+        self._lock = multiprocessing.Lock()
+        self._data = np.frombuffer(mmap.mmap(-1, self.num_blocks * block_size),
+                                   dtype=np.uint8)
+        self._next = self._shared_zeros(self.num_blocks, np.int32)
+        self._head = self._shared_zeros(num_keys, np.int32)
+        self._shape = self._shared_zeros((num_keys, ndim), np.int64)
+        self._last_used = self._shared_zeros(num_keys, np.int64)
+        # free block list head, number of free blocks and the use counter
+        self._state = self._shared_zeros(3, np.int64)
+
+        self._head[:] = -1
+        self._last_used[:] = np.iinfo(np.int64).max
+        self._next[:] = np.arange(1, self.num_blocks + 1)
+        self._next[-1] = -1
+        self._state[:] = [0, self.num_blocks, 0]
+
+    def _shared_zeros(self, shape, dtype):
+        count = int(np.prod(shape))
+        buf = mmap.mmap(-1, max(count * np.dtype(dtype).itemsize, 1))
+        return np.frombuffer(buf, dtype=dtype, count=count).reshape(shape)
+
+    def _blocks(self, key):
+        b = self._head[key]
+        while b >= 0:
+            yield b
+            b = self._next[b]
+
+    def _touch(self, key):
+        self._state[2] += 1
+        self._last_used[key] = self._state[2]
+
+    def _evict(self, key):
+        # prepend the blocks of key to the free list
+        blocks = list(self._blocks(key))
+        self._next[blocks[-1]] = self._state[0]
+        self._state[0] = blocks[0]
+        self._state[1] += len(blocks)
+        self._head[key] = -1
+        self._last_used[key] = np.iinfo(np.int64).max
+
+    def get(self, key):
+        """
+        return a copy of the array of key, or None if it is not cached
+        """
+        with self._lock:
+            if self._head[key] < 0:
+                return None
+            self._touch(key)
+            shape = tuple(self._shape[key])
+            nbytes = int(np.prod(shape)) * self.dtype.itemsize
+            out = np.empty(nbytes, dtype=np.uint8)
+            for i, b in enumerate(self._blocks(key)):
+                start = i * self.block_size
+                n = min(self.block_size, nbytes - start)
+                out[start:start + n] = self._data[b * self.block_size:
+                                                  b * self.block_size + n]
+        return out.view(self.dtype).reshape(shape)
+
+    def put(self, key, arr):
+        """
+        cache arr under key, evicting the least recently used arrays if
+        needed. Arrays larger than the cache are not cached.
+        """
+        src = np.ascontiguousarray(arr, dtype=self.dtype).reshape(-1).view(np.uint8)
+        num_blocks = max(-(-src.size // self.block_size), 1)
+        if num_blocks > self.num_blocks:
+            return
+        with self._lock:
+            if self._head[key] >= 0:
+                self._touch(key)
+                return
+            while self._state[1] < num_blocks:
+                self._evict(int(np.argmin(self._last_used)))
+            prev = -1
+            for i in xrange(num_blocks):
+                b = int(self._state[0])
+                self._state[0] = self._next[b]
+                chunk = src[i * self.block_size:(i + 1) * self.block_size]
+                self._data[b * self.block_size:
+                           b * self.block_size + chunk.size] = chunk
+                if prev < 0:
+                    self._head[key] = b
+                else:
+                    self._next[prev] = b
+                prev = b
+            self._next[prev] = -1
+            self._state[1] -= num_blocks
+            self._shape[key] = arr.shape
+            self._touch(key)
+
+    def __contains__(self, key):
+        return self._head[key] >= 0
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# Scene Graph Generation by Iterative Message Passing
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""
+Time the image preprocessing (prep_im_for_blob) with each RESIZE_BACKEND
+and compare its output with that of the 'scipy' backend. The 'numpy'
+backend must match it up to float rounding, except on the last row or
+column: scipy.ndimage.zoom (before scipy 1.6) sets them to 0 when the
+float sample position of the input edge comes out slightly past it, which
+the numpy backend does not reproduce. Such edges are counted separately.
+Exits with status 1 if the numpy backend does not match (see also
+lib/utils/blob_test.py, which also checks the flipped images).
+"""
+
+import _init_paths
+from fast_rcnn.config import cfg
+from utils.blob import prep_im_for_blob
+from utils.timer import Timer
+import numpy as np
+import argparse
+import sys
+
+# maximum absolute difference to the scipy output (pixel values are in
+# [0, 255] before the mean subtraction) that counts as equivalent
+EQUIV_TOL = 1e-3
+
+def random_image(height, width):
+    """
+    a smooth random image with some texture, as uint8 BGR
+    """
+    coarse = np.random.rand(height // 16 + 2, width // 16 + 2, 3) * 255
+    im = coarse.repeat(16, axis=0).repeat(16, axis=1)[:height, :width]
+    im += np.random.randn(height, width, 3) * 10
+    return np.clip(im, 0, 255).astype(np.uint8)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the image resize backends')
+    parser.add_argument('--backends', dest='backends', nargs='+',
+                        default=['scipy', 'numpy', 'pil', 'cv2'], type=str)
+    parser.add_argument('--repeat', dest='repeat',
+                        help='number of timed runs per image',
+                        default=5, type=int)
+    parser.add_argument('--target_size', dest='target_size',
+                        default=600, type=int)
+    parser.add_argument('--max_size', dest='max_size',
+                        default=1000, type=int)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    np.random.seed(3)
+
+    # sizes of imdb_1024 images (long side 1024) and some odd shapes
+    shapes = [(768, 1024), (1024, 683), (1024, 1024), (512, 1024), (333, 500),
+              (1024, 768), (681, 1024), (1024, 575)]
+    ims = [random_image(h, w) for h, w in shapes]
+
+    ref = []
+    cfg.RESIZE_BACKEND = 'scipy'
+    for im in ims:
+        ref.append(prep_im_for_blob(im, cfg.PIXEL_MEANS, args.target_size,
+                                    args.max_size)[0])
+
+    mismatch = False
+    print('%8s %12s %10s %10s %10s' % ('backend', 'ms / image', 'max diff',
+                                        'mean diff', 'bad edges'))
+    for backend in args.backends:
+        cfg.RESIZE_BACKEND = backend
+        timer = Timer()
+        max_diff = 0.
+        mean_diff = 0.
+        bad_edges = 0
+        try:
+            for im, ref_im in zip(ims, ref):
+                for _ in xrange(args.repeat):
+                    timer.tic()
+                    out, _ = prep_im_for_blob(im, cfg.PIXEL_MEANS,
+                                              args.target_size, args.max_size)
+                    timer.toc()
+                assert out.shape == ref_im.shape, (backend, out.shape, ref_im.shape)
+                diff = np.abs(out - ref_im)
+                # the interior, without the last row and column
+                max_diff = max(max_diff, diff[:-1, :-1].max())
+                mean_diff += diff[:-1, :-1].mean() / len(ims)
+                bad_edges += (diff[-1].max() >= EQUIV_TOL) + \
+                             (diff[:, -1].max() >= EQUIV_TOL)
+        except ImportError as e:
+            print('%8s not available (%s)' % (backend, e))
+            continue
+        print('%8s %12.2f %10.4f %10.4f %10i' % (backend, timer.average_time * 1000,
+                                                max_diff, mean_diff, bad_edges))
+        if backend == 'numpy' and max_diff >= EQUIV_TOL:
+            print('numpy resize differs from scipy by %f' % max_diff)
+            mismatch = True
+
+    sys.exit(1 if mismatch else 0)
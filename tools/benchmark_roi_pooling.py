@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# Scene Graph Generation by Iterative Message Passing
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""
+Check the CPU RoiPool and RoiPoolGrad kernels against a NumPy implementation
+and time them on the CPU for different numbers of intra-op threads, with
+the ROI counts of a training minibatch (256 object ROIs and ~1000 union
+ROIs on the conv5_3 features of a 600 x 800 image).
+"""
+
+import _init_paths
+import roi_pooling_layer.roi_pooling_op as roi_pool_op
+import roi_pooling_layer.roi_pooling_op_grad
+from utils.timer import Timer
+import tensorflow as tf
+import numpy as np
+import argparse
+
+def roi_pool_ref(data, rois, pooled_height, pooled_width, spatial_scale):
+    """max pooling of each roi (NumPy version of the CPU kernel)"""
+    num_rois = rois.shape[0]
+    _, height, width, channels = data.shape
+    out = np.zeros((num_rois, pooled_height, pooled_width, channels), dtype=data.dtype)
+    for n in xrange(num_rois):
+        b = int(rois[n, 0])
+        x1, y1, x2, y2 = [int(np.floor(v * spatial_scale + 0.5)) for v in rois[n, 1:]]
+        roi_h = max(y2 - y1 + 1, 1)
+        roi_w = max(x2 - x1 + 1, 1)
+        bin_h = np.float32(roi_h) / np.float32(pooled_height)
+        bin_w = np.float32(roi_w) / np.float32(pooled_width)
+        for ph in xrange(pooled_height):
+            hstart = min(max(int(np.floor(np.float32(ph) * bin_h)) + y1, 0), height)
+            hend = min(max(int(np.ceil(np.float32(ph + 1) * bin_h)) + y1, 0), height)
+            for pw in xrange(pooled_width):
+                wstart = min(max(int(np.floor(np.float32(pw) * bin_w)) + x1, 0), width)
+                wend = min(max(int(np.ceil(np.float32(pw + 1) * bin_w)) + x1, 0), width)
+                if hend > hstart and wend > wstart:
+                    out[n, ph, pw] = data[b, hstart:hend, wstart:wend].max(axis=(0, 1))
+    return out
+
+def roi_pool_grad_ref(data, rois, argmax, grad):
+    """gradient of roi pooling given the argmax of the forward pass"""
+    data_grad = np.zeros(data.shape, dtype=np.float64)
+    flat_grad = data_grad.reshape(data.shape[0], -1)
+    for n in xrange(rois.shape[0]):
+        inds = argmax[n].ravel()
+        keep = inds >= 0
+        np.add.at(flat_grad[int(rois[n, 0])], inds[keep], grad[n].ravel()[keep])
+    return data_grad
+
+def random_rois(num_rois, num_ims, im_height, im_width, max_size):
+    xy = np.random.uniform(0, [im_width, im_height], size=(num_rois, 2))
+    wh = np.random.uniform(16, max_size, size=(num_rois, 2))
+    x2y2 = np.minimum(xy + wh, [im_width - 1, im_height - 1])
+    batch_inds = np.random.randint(0, num_ims, size=(num_rois, 1))
+    return np.hstack([batch_inds, xy, x2y2]).astype(np.float32)
+
+def build_graph(data_shape, pooled_size, spatial_scale):
+    with tf.device('/cpu:0'):
+        data = tf.placeholder(tf.float32, shape=data_shape)
+        rois = tf.placeholder(tf.float32, shape=[None, 5])
+        top_grad = tf.placeholder(tf.float32)
+        pooled, argmax = roi_pool_op.roi_pool(data, rois, pooled_size,
+                                              pooled_size, spatial_scale)
+        data_grad = tf.gradients(pooled, [data], grad_ys=[top_grad])[0]
+    return data, rois, top_grad, pooled, argmax, data_grad
+
+def check(sess, graph, data_shape, num_rois, pooled_size, spatial_scale):
+    data, rois, top_grad, pooled, argmax, data_grad = graph
+    data_v = np.random.randn(*data_shape).astype(np.float32)
+    rois_v = random_rois(num_rois, data_shape[0], data_shape[1] / spatial_scale,
+                         data_shape[2] / spatial_scale, data_shape[1] / spatial_scale)
+    out_shape = (num_rois, pooled_size, pooled_size, data_shape[3])
+    top_grad_v = np.random.randn(*out_shape).astype(np.float32)
+    pooled_v, argmax_v, data_grad_v = sess.run([pooled, argmax, data_grad],
+        feed_dict={data: data_v, rois: rois_v, top_grad: top_grad_v})
+    assert np.array_equal(pooled_v, roi_pool_ref(data_v, rois_v, pooled_size,
+                                                 pooled_size, spatial_scale))
+    assert np.allclose(data_grad_v, roi_pool_grad_ref(data_v, rois_v, argmax_v,
+                                                      top_grad_v), atol=1e-4)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the CPU RoiPool kernels')
+    parser.add_argument('--repeat', dest='repeat',
+                        help='number of timed runs per setting',
+                        default=10, type=int)
+    parser.add_argument('--threads', dest='threads', nargs='+',
+                        help='numbers of intra-op threads to time',
+                        default=[1, 2, 4, 8], type=int)
+    parser.add_argument('--num_rois', dest='num_rois',
+                        help='object rois and union rois',
+                        default=256 + 1000, type=int)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    np.random.seed(3)
+
+    pooled_size = 7
+    spatial_scale = 1. / 16
+    # conv5_3 of a 600 x 800 image
+    data_shape = [1, 38, 50, 512]
+
+    print('%8s %12s %12s' % ('threads', 'fwd (ms)', 'fwd+bwd (ms)'))
+    for num_threads in args.threads:
+        tf.reset_default_graph()
+        graph = build_graph(data_shape, pooled_size, spatial_scale)
+        data, rois, top_grad, pooled, _, data_grad = graph
+        config = tf.ConfigProto(intra_op_parallelism_threads=num_threads,
+                                inter_op_parallelism_threads=1)
+        with tf.Session(config=config) as sess:
+            # correctness on small inputs, including two images
+            check(sess, build_graph([2, 9, 13, 3], 3, 1. / 4), [2, 9, 13, 3], 40, 3, 1. / 4)
+
+            feed_dict = {data: np.random.rand(*data_shape).astype(np.float32),
+                         rois: random_rois(args.num_rois, 1, 600, 800, 400),
+                         top_grad: np.random.rand(args.num_rois, pooled_size,
+                                                  pooled_size, data_shape[3]).astype(np.float32)}
+            sess.run(data_grad, feed_dict=feed_dict) # warm up
+            t_fwd = Timer()
+            t_bwd = Timer()
+            for _ in xrange(args.repeat):
+                t_fwd.tic()
+                sess.run(pooled, feed_dict=feed_dict)
+                t_fwd.toc()
+                t_bwd.tic()
+                sess.run(data_grad, feed_dict=feed_dict)
+                t_bwd.toc()
+        print('%8i %12.2f %12.2f' % (num_threads, t_fwd.average_time * 1000,
+                                     t_bwd.average_time * 1000))
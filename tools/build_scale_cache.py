@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# Scene Graph Generation by Iterative Message Passing
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""
+Resize the images of a dataset to the training scales for training with
+TRAIN.SCALE_CACHE_DIR
+"""
+
+import _init_paths
+from roi_data_layer.scale_cache import build_scale_cache
+from fast_rcnn.config import cfg, cfg_from_file
+from datasets.factory import get_imdb
+import argparse
+import pprint
+import sys
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Pre-resize the images of a dataset')
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional config file (TRAIN.SCALES, TRAIN.MAX_SIZE)',
+                        default=None, type=str)
+    parser.add_argument('--imdb', dest='imdb',
+                        default='imdb_1024.h5', type=str)
+    parser.add_argument('--roidb', dest='roidb',
+                        default='VG-SGG', type=str)
+    parser.add_argument('--rpndb', dest='rpndb',
+                        default='proposals.h5', type=str)
+    parser.add_argument('--split', dest='split',
+                        help='data split (0: train, 1: val, 2: test, -1: all)',
+                        default=0, type=int)
+    parser.add_argument('--output', dest='output_dir',
+                        help='cache directory',
+                        default='data/vg/scale_cache', type=str)
+    parser.add_argument('--num_workers', dest='num_workers',
+                        help='number of resizing processes',
+                        default=4, type=int)
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    # the proposals are not needed
+    cfg.TRAIN.USE_RPN_DB = False
+
+    print('Using config:')
+    pprint.pprint(cfg)
+
+    imdb = get_imdb(args.roidb, args.imdb, args.rpndb, split=args.split)
+    build_scale_cache(imdb, args.output_dir, cfg.TRAIN.SCALES,
+                      cfg.TRAIN.MAX_SIZE, num_workers=args.num_workers)
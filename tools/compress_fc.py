@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# Scene Graph Generation by Iterative Message Passing
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""
+Compress the fc6, fc7, rel_fc6 and rel_fc7 layers of a checkpoint with a
+truncated SVD (as in "Fast R-CNN", Girshick 2015): the (dim, num_out)
+weights W of a layer are replaced by weights_in = U_k S_k, (dim, k), and
+weights_out = V_k^T, (k, num_out), which cuts the cost of the layer from
+dim * num_out to k * (dim + num_out) multiply-adds per ROI.
+
+The output checkpoint is for the *_svd networks (e.g.
+dual_graph_vrd_final_svd), which read the ranks from the config file
+written next to it. Pick the ranks with svd_rank_sweep.py first:
+
+    ./tools/compress_fc.py --weights model.ckpt --output model_svd.ckpt \\
+        --fc6_rank <rank> --fc7_rank <rank>
+    ./tools/test_net.py --network dual_graph_vrd_final_svd \\
+        --weights model_svd.ckpt --cfg model_svd.ckpt.yml ...
+"""
+
+import _init_paths
+import tensorflow as tf
+import numpy as np
+import argparse
+import yaml
+import sys
+
+FC6_LAYERS = ['fc6', 'rel_fc6']
+FC7_LAYERS = ['fc7', 'rel_fc7']
+
+def svd_factorize(weights, rank):
+    """
+    factorize a (dim, num_out) weight matrix into a (dim, rank) and a
+    (rank, num_out) matrix, return them and the relative error of their
+    product (Frobenius norm)
+    """
+    assert rank <= min(weights.shape), \
+        'rank %i of a %s weight matrix' % (rank, weights.shape)
+    U, s, Vt = np.linalg.svd(weights.astype(np.float64), full_matrices=False)
+    weights_in = U[:, :rank] * s[:rank]
+    weights_out = Vt[:rank]
+    error = np.sqrt(np.sum(s[rank:] ** 2) / np.sum(s ** 2))
+    return (weights_in.astype(weights.dtype), weights_out.astype(weights.dtype),
+            error)
+
+def _save_variables(tensors, out_file):
+    # write {name: ndarray} to a checkpoint, one variable at a time so that
+    # the weights are not copied into the graph definition
+    with tf.Graph().as_default():
+        variables = []
+        for name in sorted(tensors):
+            value = tensors[name]
+            init = tf.placeholder(tf.as_dtype(value.dtype), shape=value.shape)
+            variables.append((tf.Variable(init, name=name), init, value))
+        saver = tf.train.Saver([v for v, _, _ in variables])
+        with tf.Session() as sess:
+            for var, init, value in variables:
+                sess.run(var.initializer, feed_dict={init: value})
+            saver.save(sess, out_file)
+
+def compress_checkpoint(in_file, out_file, fc6_rank, fc7_rank):
+    """
+    write a copy of the checkpoint in_file with truncated SVD fc layers to
+    out_file, return the relative error of each compressed layer
+    """
+    reader = tf.train.NewCheckpointReader(in_file)
+    var_names = reader.get_variable_to_shape_map().keys()
+    ranks = dict([(l, fc6_rank) for l in FC6_LAYERS] +
+                 [(l, fc7_rank) for l in FC7_LAYERS])
+
+    tensors = {}
+    errors = {}
+    for name in var_names:
+        layer = name.split('/')[0]
+        if layer in ranks and name.startswith(layer + '/weights'):
+            # the weights (and their optimizer slots) are replaced
+            continue
+        tensors[name] = reader.get_tensor(name)
+
+    for layer in sorted(ranks):
+        name = layer + '/weights'
+        if name not in var_names:
+            print('%s is not in %s, skipped' % (name, in_file))
+            continue
+        weights = reader.get_tensor(name)
+        weights_in, weights_out, errors[layer] = \
+            svd_factorize(weights, ranks[layer])
+        tensors[layer + '/weights_in'] = weights_in
+        tensors[layer + '/weights_out'] = weights_out
+        print('%s: %s -> %s x %s, relative error %.4f' %
+              (layer, weights.shape, weights_in.shape, weights_out.shape,
+               errors[layer]))
+
+    _save_variables(tensors, out_file)
+
+    # the config of the ranks, for test_net.py --cfg
+    with open(out_file + '.yml', 'w') as f:
+        yaml.dump({'TEST': {'SVD_FC6_RANK': fc6_rank,
+                            'SVD_FC7_RANK': fc7_rank}},
+                  f, default_flow_style=False)
+    return errors
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Compress the fc layers of a checkpoint with a truncated SVD')
+    parser.add_argument('--weights', dest='weights',
+                        help='checkpoint to compress',
+                        default=None, type=str)
+    parser.add_argument('--output', dest='output',
+                        help='compressed checkpoint',
+                        default=None, type=str)
+    parser.add_argument('--fc6_rank', dest='fc6_rank',
+                        help='rank of fc6 and rel_fc6 (see svd_rank_sweep.py)',
+                        required=True, type=int)
+    parser.add_argument('--fc7_rank', dest='fc7_rank',
+                        help='rank of fc7 and rel_fc7 (see svd_rank_sweep.py)',
+                        required=True, type=int)
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    compress_checkpoint(args.weights, args.output, args.fc6_rank, args.fc7_rank)
+    print('Wrote %s (config: %s.yml)' % (args.output, args.output))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# Scene Graph Generation by Iterative Message Passing
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""
+Evaluate the predictions dumped by tools/test_net.py --dump, without running
+the network (and without TensorFlow). The recalls are the same as those of
+test_net for K up to the top_k of the dump; for larger K they are lower
+bounds.
+"""
+
+import _init_paths
+from fast_rcnn.config import cfg, cfg_from_file
+from datasets.factory import get_imdb
+from datasets.evaluator import SceneGraphEvaluator
+from datasets.pred_dump import PredictionReader
+from roi_data_layer.roidb import prepare_test_roidb_entry
+import argparse
+import pprint
+import sys
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Evaluate dumped scene graph predictions')
+    parser.add_argument('--dump', dest='dump_files', nargs='+',
+                        help='prediction dumps written by test_net.py (e.g. '
+                             'the dumps of all shards of a test run)',
+                        default=None, type=str)
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional config file', default=None, type=str)
+    parser.add_argument('--imdb', dest='imdb',
+                        help='dataset to test',
+                        default='im_512.h5', type=str)
+    parser.add_argument('--roidb', dest='roidb',
+                        help='dataset to test',
+                        default='VG', type=str)
+    parser.add_argument('--rpndb', dest='rpndb',
+                        help='dataset to test',
+                        default='proposals.h5', type=str)
+    parser.add_argument('--test_size', dest='test_size',
+                        default=1000, type=int)
+    parser.add_argument('--recall_k', dest='recall_k', nargs='+',
+                        help='K of R@K (default: TEST.RECALL_K)',
+                        default=None, type=int)
+    parser.add_argument('--iou_thresh', dest='iou_thresh',
+                        default=0.5, type=float)
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.recall_k is not None:
+        cfg.TEST.RECALL_K = tuple(args.recall_k)
+
+    print('Using config:')
+    pprint.pprint(cfg)
+
+    # use the same roidb (and test split) as test_net.py
+    imdb = get_imdb(args.roidb, args.imdb, args.rpndb, split=2, num_im=args.test_size)
+    roidb = imdb.roidb
+
+    dumps = [PredictionReader(fn) for fn in args.dump_files]
+    top_ks = [dump.top_k for dump in dumps if dump.top_k > 0]
+    if len(top_ks) > 0 and max(cfg.TEST.RECALL_K) > min(top_ks):
+        print('Warning: the dump only holds the top %i triplets of each '
+              'image, R@K for larger K is a lower bound' % min(top_ks))
+
+    groups = sorted(set(sum([dump.groups() for dump in dumps], [])))
+    multi_iter = len(set([iter_n for _, iter_n in groups])) > 1
+    for mode, iter_n in groups:
+        evaluator = SceneGraphEvaluator(imdb, mode=mode)
+        for dump in dumps:
+            if (mode, iter_n) not in dump.groups():
+                continue
+            for im_i, triplets, triplet_boxes, _, _ in dump.entries(mode, iter_n):
+                roidb_entry = prepare_test_roidb_entry(imdb, roidb[im_i])
+                evaluator.evaluate_triplets(triplets, triplet_boxes, im_i,
+                                            iou_thresh=args.iou_thresh,
+                                            roidb_entry=roidb_entry)
+        if multi_iter:
+            print('inference iteration %i:' % iter_n)
+        evaluator.print_stats()
+    for dump in dumps:
+        dump.close()
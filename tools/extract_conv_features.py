@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# Scene Graph Generation by Iterative Message Passing
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""
+Precompute conv5_3 feature maps for training with TRAIN.USE_CONV_CACHE
+"""
+
+import _init_paths
+from fast_rcnn.extract import extract_conv_features
+from fast_rcnn.config import cfg, cfg_from_file
+from datasets.factory import get_imdb
+import argparse
+import pprint
+import numpy as np
+import sys
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Precompute conv features of a dataset')
+    parser.add_argument('--weights', dest='weights',
+                        help='trunk weights (.npy or .ckpt)',
+                        default=None, type=str)
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional config file',
+                        default=None, type=str)
+    parser.add_argument('--imdb', dest='imdb',
+                        default='imdb_1024.h5', type=str)
+    parser.add_argument('--roidb', dest='roidb',
+                        default='VG-SGG', type=str)
+    parser.add_argument('--rpndb', dest='rpndb',
+                        default='proposals.h5', type=str)
+    parser.add_argument('--split', dest='split',
+                        help='data split (0: train, 1: val, 2: test, -1: all)',
+                        default=0, type=int)
+    parser.add_argument('--output', dest='output_dir',
+                        help='cache directory',
+                        default='data/vg/conv_cache', type=str)
+    parser.add_argument('--dtype', dest='dtype',
+                        help='storage type of the features (float32 or float16)',
+                        default='float32', type=str)
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+
+    print('Using config:')
+    pprint.pprint(cfg)
+
+    imdb = get_imdb(args.roidb, args.imdb, args.rpndb, split=args.split)
+    extract_conv_features(args.weights, imdb, args.output_dir,
+                          dtype=np.dtype(args.dtype))
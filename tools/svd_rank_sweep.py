@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# Scene Graph Generation by Iterative Message Passing
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""
+Compress a checkpoint at several fc6 / fc7 ranks (see compress_fc.py) and
+report the test speed and R@50 of each rank for sg_cls and sg_det, next to
+those of the uncompressed network, to pick the rank of the *_svd networks:
+
+    ./tools/svd_rank_sweep.py --weights model.ckpt --output_dir svd/ \\
+        --ranks 1024:256 512:128 256:64 --test_size 500
+"""
+
+import _init_paths
+from fast_rcnn.test import _setup_test_net, _run_test
+from fast_rcnn.config import cfg, cfg_from_file
+from datasets.factory import get_imdb
+from compress_fc import compress_checkpoint
+from utils.timer import Timer
+import tensorflow as tf
+import argparse
+import os, sys
+
+MODES = ['sg_cls', 'sg_det']
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='Speed and recall of truncated SVD fc layers')
+    parser.add_argument('--weights', dest='weights',
+                        help='uncompressed checkpoint',
+                        default=None, type=str)
+    parser.add_argument('--network', dest='network_name',
+                        help='name of the uncompressed network (<network>_svd '
+                             'is the compressed one)',
+                        default='dual_graph_vrd_final', type=str)
+    parser.add_argument('--ranks', dest='ranks', nargs='+',
+                        help='candidate fc6_rank:fc7_rank pairs',
+                        default=['1024:256', '512:128', '256:64'], type=str)
+    parser.add_argument('--output_dir', dest='output_dir',
+                        help='directory of the compressed checkpoints',
+                        default=None, type=str)
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional config file', default=None, type=str)
+    parser.add_argument('--imdb', dest='imdb',
+                        help='dataset to test',
+                        default='im_512.h5', type=str)
+    parser.add_argument('--roidb', dest='roidb',
+                        help='dataset to test',
+                        default='VG', type=str)
+    parser.add_argument('--rpndb', dest='rpndb',
+                        help='dataset to test',
+                        default='proposals.h5', type=str)
+    parser.add_argument('--inference_iter', dest='inference_iter',
+                        default=3, type=int)
+    parser.add_argument('--test_size', dest='test_size',
+                        default=500, type=int)
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    args = parser.parse_args()
+    return args
+
+def fc_cost(fc6_rank, fc7_rank):
+    """
+    multiply-adds of the fc6 and fc7 layers of a ROI (None: uncompressed)
+    """
+    fc6_in, fc6_out, fc7_out = 7 * 7 * 512, 4096, 4096
+    if fc6_rank is None:
+        return fc6_in * fc6_out + fc6_out * fc7_out
+    return (fc6_rank * (fc6_in + fc6_out) + fc7_rank * (fc6_out + fc7_out))
+
+def test_speed_recall(net_name, weights, imdb):
+    """
+    return {mode: (seconds per image, R@50)}
+    """
+    tf.reset_default_graph()
+    sess, net, inputs = _setup_test_net(net_name, weights, imdb)
+    im_inds = range(len(imdb.image_index))
+    results = {}
+    for mode in MODES:
+        # the first image also pays for the graph setup, leave it out
+        _run_test(sess, net, inputs, imdb, mode, im_inds[:1])
+        timer = Timer()
+        timer.tic()
+        evaluators = _run_test(sess, net, inputs, imdb, mode, im_inds)
+        timer.toc()
+        evaluator = evaluators[mode][max(evaluators[mode])]
+        results[mode] = (timer.total_time / len(im_inds), evaluator.recall(50))
+    sess.close()
+    return results
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    cfg.TEST.INFERENCE_ITER = args.inference_iter
+    if 50 not in cfg.TEST.RECALL_K:
+        cfg.TEST.RECALL_K = tuple(cfg.TEST.RECALL_K) + (50,)
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    imdb = get_imdb(args.roidb, args.imdb, args.rpndb, split=2, num_im=args.test_size)
+
+    rows = [('full', None, None,
+             test_speed_recall(args.network_name, args.weights, imdb))]
+    for ranks in args.ranks:
+        fc6_rank, fc7_rank = [int(r) for r in ranks.split(':')]
+        svd_weights = os.path.join(args.output_dir, '%s_svd%i_%i.ckpt' %
+                                   (os.path.basename(args.weights), fc6_rank, fc7_rank))
+        compress_checkpoint(args.weights, svd_weights, fc6_rank, fc7_rank)
+        cfg.TEST.SVD_FC6_RANK = fc6_rank
+        cfg.TEST.SVD_FC7_RANK = fc7_rank
+        rows.append((ranks, fc6_rank, fc7_rank,
+                     test_speed_recall(args.network_name + '_svd', svd_weights, imdb)))
+
+    full_cost = fc_cost(None, None)
+    print('%10s %9s' % ('ranks', 'fc cost') +
+          ''.join(['%12s %10s' % (m + ' s/im', 'R@50') for m in MODES]))
+    for name, fc6_rank, fc7_rank, results in rows:
+        line = '%10s %9.3f' % (name, float(fc_cost(fc6_rank, fc7_rank)) / full_cost)
+        for mode in MODES:
+            line += '%12.3f %10.4f' % results[mode]
+        print(line)
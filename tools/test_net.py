@@ -8,7 +8,7 @@
 # --------------------------------------------------------
 
 import _init_paths
-from fast_rcnn.test import test_net
+from fast_rcnn.test import test_net, test_net_sharded
 from fast_rcnn.visualize import viz_net
 from fast_rcnn.config import cfg, cfg_from_file
 from datasets.factory import get_imdb
@@ -48,6 +48,18 @@ def parse_args():
                         default=None, type=str)
     parser.add_argument('--inference_iter', dest='inference_iter',
                         default=3, type=int)
+    parser.add_argument('--eval_all_iters', dest='eval_all_iters',
+                        help='evaluate every inference iteration',
+                        action='store_true')
+    parser.add_argument('--dump', dest='dump_file',
+                        help='write the top predicted triplets to this file',
+                        default=None, type=str)
+    parser.add_argument('--num_shards', dest='num_shards',
+                        help='number of test processes',
+                        default=1, type=int)
+    parser.add_argument('--ckpt_dir', dest='ckpt_dir',
+                        help='save (and resume from) the evaluation state in this directory',
+                        default=None, type=str)
     parser.add_argument('--test_size', dest='test_size',
                         default=1000, type=int)
     parser.add_argument('--test_mode', dest='test_mode',
@@ -69,6 +81,8 @@ if __name__ == '__main__':
         cfg_from_file(args.cfg_file)
 
     cfg.TEST.INFERENCE_ITER = args.inference_iter
+    if args.eval_all_iters:
+        cfg.TEST.EVAL_ALL_ITERS = True
 
     print('Using config:')
     pprint.pprint(cfg)
@@ -89,5 +103,15 @@ if __name__ == '__main__':
     imdb = get_imdb(args.roidb, args.imdb, args.rpndb, split=2, num_im=args.test_size)
     if args.test_mode == 'viz_cls' or args.test_mode == 'viz_det':  # visualize result
         viz_net(args.network_name, args.model, imdb, args.test_mode)
+    elif args.num_shards > 1:
+        assert args.ckpt_dir is not None, 'a sharded test needs a --ckpt_dir'
+        test_net_sharded(args.network_name, args.model, imdb, args.test_mode,
+                         args.num_shards, args.ckpt_dir, dump_file=args.dump_file)
     else:
-        test_net(args.network_name, args.model, imdb, args.test_mode)
+        ckpt_file = None
+        if args.ckpt_dir is not None:
+            if not os.path.exists(args.ckpt_dir):
+                os.makedirs(args.ckpt_dir)
+            ckpt_file = os.path.join(args.ckpt_dir, 'test.npy')
+        test_net(args.network_name, args.model, imdb, args.test_mode,
+                 dump_file=args.dump_file, ckpt_file=ckpt_file)
@@ -92,9 +92,10 @@ if __name__ == '__main__':
     # compute bbox target mean and stds if not precomputed
     if False:
         print('precomputing target means...')
-        imdb.add_rpn_rois(roidb, make_copy=False)
-        prepare_roidb(roidb)
-        bbox_means, bbox_stds = compute_bbox_target_normalization(roidb)
+        # materialize the roidb entries, they are updated in place
+        norm_roidb = imdb.add_rpn_rois(list(roidb), make_copy=False)
+        prepare_roidb(norm_roidb)
+        bbox_means, bbox_stds = compute_bbox_target_normalization(norm_roidb)
         print(bbox_means)
         print(bbox_stds)
         np.save(cfg.TRAIN.BBOX_TARGET_NORMALIZATION_FILE, {'means': bbox_means, 'stds': bbox_stds})